@@ -1,11 +1,17 @@
 import os
+import atexit
+import click
 from flask import Flask
 from flask_restful import Api
 from flask_migrate import Migrate
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
-from models import db
+
+load_dotenv()
+
+from models import db, Router
 from datetime import timedelta
 from flask_jwt_extended import JWTManager
 from resources.users import UserResource
@@ -14,9 +20,17 @@ from resources.sessions import SessionsResource
 from resources.transaction import TransactionsResource
 from resources.mpesa import MpesaResource, MpesaCallbackResource
 from resources.auth import SignUpResource, LoginResource
-from scheduler import start_scheduler
-
-load_dotenv()
+from resources.router import close_router_pools
+from resources.metrics import MetricsResource
+from resources.reports import ReportsResource
+from resources.exports import TransactionExportResource
+from resources.serializers import output_json
+from rate_limits import limiter
+from callback_queue import callback_queue
+from sql_instrumentation import SQLInstrumentation
+from db_engine import database_url, engine_options
+from scheduler import job_leader
+from hashing import benchmark, password_hasher
 
 #FLASK APP INITIALIZATION
 app = Flask(__name__)
@@ -27,10 +41,18 @@ if ENVIRONMENT == "production":
     DATABASE_URL = os.environ.get("SUPABASE_URL")
 else:
     DATABASE_URL = os.environ.get("DATABASE_URL")
+DATABASE_URL = database_url(DATABASE_URL)
 
 app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(DATABASE_URL)
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ECHO"] = True
+app.config["SQLALCHEMY_ECHO"] = os.environ.get("SQLALCHEMY_ECHO", "false").lower() == "true"
+
+# Behind a reverse proxy the client address comes from X-Forwarded-For; trust one entry per proxy
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", 0))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS,
+                            x_host=TRUSTED_PROXY_HOPS)
 
 #EXTENSIONS
 db.init_app(app)
@@ -39,7 +61,21 @@ CORS(app, origins=[FRONTEND_URL, "http://localhost:5173"])
 migrate = Migrate(app, db)
 bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
+limiter.init_app(app)
 api = Api(app)
+api.representation('application/json')(output_json)
+sql_instrumentation = SQLInstrumentation(app)
+
+# RouterOS sessions are pooled for the life of the process
+atexit.register(close_router_pools)
+
+# M-Pesa callbacks are applied by a worker pool, started on the first request
+callback_queue.init_app(app)
+
+# Expiry and sweep jobs run in one elected process across all workers and hosts
+if os.environ.get("BACKGROUND_JOBS", "true").lower() == "true":
+    job_leader.init_app(app)
+    atexit.register(job_leader.stop)
 
 # JWT configuration
 if ENVIRONMENT == "production":
@@ -67,7 +103,33 @@ api.add_resource(MpesaResource, '/mpesa/stkpush')
 api.add_resource(MpesaCallbackResource, '/mpesa/callback')
 api.add_resource(SignUpResource, '/auth/signup')
 api.add_resource(LoginResource, '/auth/login')
+api.add_resource(MetricsResource, '/metrics')
+api.add_resource(ReportsResource, '/reports')
+api.add_resource(TransactionExportResource, '/transactions/export')
+
+@app.cli.command("bcrypt-benchmark")
+@click.option("--target-ms", default=250, help="Acceptable time for one password hash.")
+def bcrypt_benchmark(target_ms):
+    """Times bcrypt on this machine and suggests a BCRYPT_LOG_ROUNDS."""
+    timings, recommended = benchmark(target_ms)
+    for rounds, elapsed_ms in timings:
+        print(f"rounds={rounds:<3} {elapsed_ms:8.1f} ms")
+    print(f"Recommended BCRYPT_LOG_ROUNDS={recommended} (currently {password_hasher.rounds})")
+
+@app.cli.command("router-add")
+@click.argument("name")
+@click.argument("host")
+@click.option("--port", default=8728, help="RouterOS API port.")
+@click.option("--username", default=lambda: os.environ.get("MIKROTIK_USERNAME"), help="Defaults to MIKROTIK_USERNAME.")
+@click.option("--password", default=None, help="Leave unset to use MIKROTIK_PASSWORD.")
+@click.option("--max-sessions", type=int, default=None, help="Defaults to MIKROTIK_MAX_SESSIONS.")
+def router_add(name, host, port, username, password, max_sessions):
+    """Registers a hotspot site; the portal sends NAME as `site` with each purchase."""
+    db.session.add(Router(name=name, host=host, api_port=port, username=username,
+                          password=password, max_sessions=max_sessions))
+    db.session.commit()
+    print(f"Router {name} ({host}:{port}) registered.")
 
 if __name__ == "__main__":
-    start_scheduler()
+    job_leader.start(app)
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,98 @@
+import os
+from datetime import date, datetime, timedelta
+from models import db, Transaction, TransactionArchive, Session, UsageSample
+
+# Statuses a transaction never leaves
+TERMINAL_STATUSES = ('expired', 'failed', 'failed_authorization', 'capped')
+
+ARCHIVED_COLUMNS = [column.name for column in TransactionArchive.__table__.columns if column.name != 'archived_at']
+
+
+def month_partitions(start, end):
+    """(name, first day, first day of next month) for each month from `start` to `end`."""
+    month = date(start.year, start.month, 1)
+    while month <= end.date():
+        next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        yield f'transactions_archive_{month:%Y_%m}', month, next_month
+        month = next_month
+
+
+class TransactionArchiver:
+    """Moves finished transactions out of the live table.
+
+    Rows in a terminal status, older than `after_days` and already counted
+    in the rollups are copied into transactions_archive and deleted from
+    transactions in the same DB transaction, `batch_size` at a time and at
+    most `max_batches` per run. This keeps the table the callback lookup,
+    expiry sweep, reconciler and usage collector read down to recent and
+    unfinished purchases. Rows a session still points at stay put. Usage
+    samples of archived rows are dropped; their totals live on in
+    bytes_used and the rollups. On Postgres the archive is range-partitioned
+    by month, and the partitions a batch needs are created before it is
+    copied.
+    """
+
+    def __init__(self, after_days=90, batch_size=1000, max_batches=50):
+        self.after = timedelta(days=after_days)
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._partitions = set()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            after_days=int(os.environ.get('ARCHIVE_AFTER_DAYS', 90)),
+            batch_size=int(os.environ.get('ARCHIVE_BATCH_SIZE', 1000)),
+            max_batches=int(os.environ.get('ARCHIVE_MAX_BATCHES', 50)),
+        )
+
+    def ensure_partitions(self, start, end):
+        """Creates the monthly archive partitions covering `start` to `end`; a no-op outside Postgres."""
+        if db.session.get_bind().dialect.name != 'postgresql':
+            return
+        for name, month, next_month in month_partitions(start, end):
+            if name in self._partitions:
+                continue
+            db.session.execute(db.text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF transactions_archive "
+                f"FOR VALUES FROM ('{month}') TO ('{next_month}')"
+            ))
+            db.session.commit()
+            self._partitions.add(name)
+
+    def run(self, app):
+        """One archival pass; returns how many transactions were moved."""
+        moved = 0
+        with app.app_context():
+            cutoff = datetime.now() - self.after  # Transaction.created_at is local time
+            for _ in range(self.max_batches):
+                rows = db.session.query(Transaction.id, Transaction.created_at).filter(
+                    Transaction.status.in_(TERMINAL_STATUSES),
+                    Transaction.created_at < cutoff,
+                    Transaction.rolled_up,
+                    ~db.exists().where(Session.transaction_id == Transaction.id)
+                ).order_by(Transaction.created_at).limit(self.batch_size).all()
+                if not rows:
+                    break
+                ids = [row.id for row in rows]
+                self.ensure_partitions(rows[0].created_at, rows[-1].created_at)
+
+                db.session.execute(db.delete(UsageSample).where(UsageSample.transaction_id.in_(ids)))
+                db.session.execute(db.insert(TransactionArchive).from_select(
+                    ARCHIVED_COLUMNS,
+                    db.select(*[getattr(Transaction, name) for name in ARCHIVED_COLUMNS]).where(Transaction.id.in_(ids))
+                ))
+                db.session.execute(db.delete(Transaction).where(Transaction.id.in_(ids)))
+                db.session.commit()
+                moved += len(ids)
+
+        if moved:
+            print(f"Archived {moved} finished transactions.")
+        return moved
+
+
+transaction_archiver = TransactionArchiver.from_env()
+
+
+def archive_transactions(app):
+    transaction_archiver.run(app)
@@ -0,0 +1,175 @@
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from models import db, MpesaCallback
+from metrics import metrics
+
+
+class CallbackQueue:
+    """Bounded worker pool that applies persisted M-Pesa callbacks off the request path.
+
+    The callback endpoint stores the raw payload and hands its id over here.
+    Workers claim a row with a conditional UPDATE, so the same payload is never
+    applied twice even when several processes share the table. Rows that do
+    not fit in the queue, are waiting on a retry, or were left mid-flight by a
+    restart are picked up again by a periodic resume scan.
+    """
+
+    def __init__(self, workers=4, max_depth=1000, max_attempts=5,
+                 retry_backoff=2.0, resume_interval=5.0, stale_after=300):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.resume_interval = resume_interval
+        self.stale_after = stale_after
+
+        self.app = None
+        self._queue = queue.Queue(maxsize=max_depth)
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._started = False
+
+        metrics.gauge('callback_queue_depth', self._queue.qsize)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            workers=int(os.environ.get('CALLBACK_WORKERS', 4)),
+            max_depth=int(os.environ.get('CALLBACK_QUEUE_SIZE', 1000)),
+            max_attempts=int(os.environ.get('CALLBACK_MAX_ATTEMPTS', 5)),
+        )
+
+    def init_app(self, app):
+        """Starts the workers on the app's first request, in whichever process serves it."""
+        self.app = app
+        app.before_request(self.start)
+
+    def start(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"callback-worker-{i}", daemon=True).start()
+        threading.Thread(target=self._resume_loop, name="callback-resume", daemon=True).start()
+
+    def submit(self, callback_id):
+        """Queues a persisted callback; returns False when it was left for the resume scan."""
+        with self._lock:
+            if callback_id in self._queued:
+                return True
+            try:
+                self._queue.put_nowait((callback_id, time.monotonic()))
+            except queue.Full:
+                metrics.incr('callback_queue_overflow')
+                return False
+            self._queued.add(callback_id)
+        metrics.incr('callback_queue_enqueued')
+        return True
+
+    def _work(self):
+        while True:
+            callback_id, enqueued_at = self._queue.get()
+            metrics.observe('callback_queue_wait_seconds', time.monotonic() - enqueued_at)
+            with self._lock:
+                self._queued.discard(callback_id)
+
+            started = time.monotonic()
+            with self.app.app_context():
+                try:
+                    self._process(callback_id)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Callback {callback_id} crashed the worker: {e}")
+                finally:
+                    db.session.remove()
+            metrics.observe('callback_processing_seconds', time.monotonic() - started)
+            self._queue.task_done()
+
+    def _process(self, callback_id):
+        from resources.mpesa import apply_stk_callback, UnknownCheckout
+
+        now = datetime.utcnow()
+        claimed = MpesaCallback.query.filter_by(id=callback_id, status='pending').update({
+            MpesaCallback.status: 'processing',
+            MpesaCallback.claimed_at: now,
+            MpesaCallback.attempts: MpesaCallback.attempts + 1,
+        }, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return
+
+        callback = db.session.get(MpesaCallback, callback_id)
+        last_attempt = callback.attempts >= self.max_attempts
+        orphaned = False
+        try:
+            stk_callback = json.loads(callback.payload).get('Body', {}).get('stkCallback', {})
+            done = apply_stk_callback(stk_callback, last_attempt=last_attempt)
+            error = None if done else "Router authorization failed"
+        except UnknownCheckout as e:
+            db.session.rollback()
+            done, error, orphaned = False, str(e), True
+        except Exception as e:
+            db.session.rollback()
+            done, error = False, str(e)
+
+        if done:
+            callback.status = 'processed'
+            callback.processed_at = datetime.utcnow()
+            metrics.incr('callback_processed')
+        elif last_attempt:
+            # A payment with no transaction to apply it to is kept apart for follow-up
+            callback.status = 'orphaned' if orphaned else 'failed'
+            callback.last_error = error
+            metrics.incr(f'callback_{callback.status}')
+            print(f"Giving up on callback {callback_id} after {callback.attempts} attempts: {error}")
+        else:
+            callback.status = 'pending'
+            callback.last_error = error
+            callback.next_attempt_at = datetime.utcnow() + timedelta(
+                seconds=self.retry_backoff * 2 ** (callback.attempts - 1))
+            metrics.incr('callback_retried')
+        db.session.commit()
+
+    def _resume_loop(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    self.resume()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Callback resume scan failed: {e}")
+                finally:
+                    db.session.remove()
+            time.sleep(self.resume_interval)
+
+    def resume(self):
+        """Re-queues callbacks that are due but not in the queue."""
+        free = self._queue.maxsize - self._queue.qsize()
+        if free <= 0:
+            return
+
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.stale_after)
+        # Rows stuck in 'processing' belong to a worker that died mid-flight
+        MpesaCallback.query.filter(
+            MpesaCallback.status == 'processing',
+            MpesaCallback.claimed_at < stale
+        ).update({MpesaCallback.status: 'pending'}, synchronize_session=False)
+        db.session.commit()
+
+        due = db.session.query(MpesaCallback.id).filter(
+            MpesaCallback.status == 'pending',
+            db.or_(MpesaCallback.next_attempt_at.is_(None), MpesaCallback.next_attempt_at <= now)
+        ).order_by(MpesaCallback.id).limit(free).all()
+        for (callback_id,) in due:
+            if not self.submit(callback_id):
+                break
+
+
+callback_queue = CallbackQueue.from_env()
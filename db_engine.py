@@ -0,0 +1,70 @@
+import os
+import time
+from sqlalchemy.pool import QueuePool
+from metrics import metrics
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that reports checkout wait and saturation through /metrics."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        metrics.gauge('db_pool_checked_out', self.checkedout)
+        metrics.gauge('db_pool_overflow', lambda: max(0, self.overflow()))
+        metrics.gauge('db_pool_saturation', self.saturation)
+
+    def saturation(self):
+        """Share of the pool's connections (including overflow) in use, 0.0 to 1.0."""
+        capacity = self.size() + max(0, self._max_overflow)
+        return round(self.checkedout() / capacity, 3) if capacity else 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            metrics.incr('db_pool_checkout_errors')
+            raise
+        finally:
+            metrics.observe('db_pool_checkout_wait_seconds', time.perf_counter() - started)
+
+
+def transaction_pooler():
+    """True when the database is reached through PgBouncer or Supabase in transaction mode."""
+    return os.environ.get('DB_POOL_MODE', 'session').lower() == 'transaction'
+
+
+def database_url(url):
+    # Supabase and Heroku hand out postgres:// URLs, which SQLAlchemy 2 rejects
+    if url and url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url):
+    """SQLALCHEMY_ENGINE_OPTIONS for `url`, read from the DB_POOL_* variables.
+
+    Transaction mode (DB_POOL_MODE=transaction) is for a pooler that hands a
+    server connection out per transaction. Nothing may outlive a transaction
+    there, so psycopg 3 gets prepared statements switched off (psycopg2
+    never prepares server-side).
+    Session-level features are not used in this mode either: leader
+    election falls back to its lease table.
+    """
+    if not url or url.startswith('sqlite'):
+        return {}
+
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        # Below the server's / pooler's idle timeout so we never reuse a cut connection
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        'pool_use_lifo': True,
+    }
+
+    if transaction_pooler() and url.startswith('postgresql+psycopg:'):
+        options['connect_args'] = {'prepare_threshold': None}
+    return options
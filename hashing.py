@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import bcrypt
+from metrics import metrics
+
+
+class HasherBusy(Exception):
+    """Raised when too many password hashes are already running or queued."""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small, bounded worker pool instead of the request thread.
+
+    bcrypt releases the GIL while it works, so `workers` threads hash in
+    parallel on as many cores; size it to the cores left over for hashing.
+    At most `max_queue` more requests wait for a worker, for up to
+    `queue_timeout` seconds. Anything beyond that is refused with HasherBusy
+    so a login storm cannot tie up every gunicorn thread.
+    """
+
+    def __init__(self, rounds=12, workers=2, max_queue=16, queue_timeout=5.0):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        metrics.gauge('password_hash_in_flight', lambda: self._in_flight)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            rounds=int(os.environ.get('BCRYPT_LOG_ROUNDS', 12)),
+            workers=int(os.environ.get('HASH_WORKERS', 2)),
+            max_queue=int(os.environ.get('HASH_MAX_QUEUE', 16)),
+            queue_timeout=float(os.environ.get('HASH_QUEUE_TIMEOUT', 5)),
+        )
+
+    def _pool(self):
+        # Created lazily so each gunicorn worker gets its own after the fork
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            metrics.incr('password_hash_shed')
+            raise HasherBusy("Too many password checks in progress")
+        with self._lock:
+            self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            future = self._pool().submit(func, *args)
+            try:
+                return future.result(timeout=self.queue_timeout)
+            except FutureTimeout:
+                if future.cancel():
+                    metrics.incr('password_hash_shed')
+                    raise HasherBusy("Password check timed out waiting for a worker")
+                # Already hashing; let it finish
+                return future.result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+            metrics.observe('password_hash_seconds', time.perf_counter() - started)
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.rounds)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when the stored hash was made with a different cost than the configured one."""
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+
+def hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def check_password(password_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        # Malformed stored hash
+        return False
+
+
+def benchmark(target_ms=250, min_rounds=10, max_rounds=16):
+    """Times one hash at each cost and returns (timings, recommended rounds).
+
+    The recommendation is the highest cost whose hash stays under
+    `target_ms` on this machine.
+    """
+    timings = []
+    recommended = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        started = time.perf_counter()
+        hash_password('benchmark-password', rounds)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        timings.append((rounds, elapsed_ms))
+        if elapsed_ms <= target_ms:
+            recommended = rounds
+        else:
+            break
+    return timings, recommended
+
+
+password_hasher = PasswordHasher.from_env()
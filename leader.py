@@ -0,0 +1,170 @@
+import os
+import socket
+import threading
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import or_, text
+from sqlalchemy.exc import IntegrityError
+from models import db, JobLease
+from db_engine import transaction_pooler
+
+
+class LeaderElection:
+    """Elects one process among all gunicorn workers and hosts to run a job group.
+
+    On Postgres the leader holds a session-level advisory lock on a dedicated
+    connection. The lock goes away with the connection, so a crashed leader is
+    replaced on the next `interval` tick of a follower. Elsewhere (SQLite, or
+    DB_POOL_MODE=transaction behind a pooler such as Supabase's port 6543,
+    where session locks do not stick to a client) a row in job_leases is held
+    by renewing it every tick; a dead leader's lease lapses after `lease_ttl`.
+
+    `on_elected(app)` is called when this process becomes leader and
+    `on_demoted()` when it loses the lock or lease.
+    """
+
+    def __init__(self, name, on_elected, on_demoted, backend='auto', interval=5.0, lease_ttl=30.0):
+        self.name = name
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.backend = backend
+        self.interval = interval
+        self.lease_ttl = timedelta(seconds=lease_ttl)
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        # Advisory lock keys are bigints; derive a stable one from the name
+        self.lock_key = zlib.crc32(f"leader:{name}".encode())
+
+        self.app = None
+        self.is_leader = False
+        self._conn = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, name, on_elected, on_demoted):
+        return cls(
+            name, on_elected, on_demoted,
+            backend=os.environ.get('LEADER_BACKEND', 'auto'),
+            interval=float(os.environ.get('LEADER_INTERVAL', 5)),
+            lease_ttl=float(os.environ.get('LEADER_LEASE_TTL', 30)),
+        )
+
+    def init_app(self, app):
+        self.app = app
+        # Started on the first request so it runs in the forked worker, not
+        # in the gunicorn master or in flask CLI commands
+        app.before_request(self.start)
+
+    def start(self, app=None):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.app = app or self.app
+            self.holder = f"{socket.gethostname()}:{os.getpid()}"
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"leader-{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Steps down and releases the lock or lease so a follower takes over at once."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout=self.interval + 5)
+        self._set_leader(False)
+        try:
+            with self.app.app_context():
+                self._release()
+        except Exception as e:
+            print(f"Could not release {self.name} leadership: {e}")
+
+    def _uses_advisory_lock(self):
+        if self.backend == 'auto':
+            return db.engine.dialect.name == 'postgresql' and not transaction_pooler()
+        return self.backend == 'advisory'
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    held = self._try_advisory() if self._uses_advisory_lock() else self._try_lease()
+            except Exception as e:
+                print(f"Leader election for {self.name} failed: {e}")
+                self._drop_connection()
+                held = False
+            self._set_leader(held)
+            self._stop.wait(self.interval)
+
+    def _set_leader(self, held):
+        if held and not self.is_leader:
+            self.is_leader = True
+            print(f"{self.holder} elected leader for {self.name}.")
+            self.on_elected(self.app)
+        elif not held and self.is_leader:
+            self.is_leader = False
+            print(f"{self.holder} lost leadership for {self.name}.")
+            self.on_demoted()
+
+    def _try_advisory(self):
+        if self._conn is not None:
+            # Still holding it as long as the session that took the lock is alive
+            self._conn.execute(text("SELECT 1"))
+            return True
+
+        conn = db.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key}).scalar()
+        except Exception:
+            conn.invalidate()
+            conn.close()
+            raise
+        if acquired:
+            self._conn = conn
+        else:
+            conn.close()
+        return bool(acquired)
+
+    def _try_lease(self):
+        now = datetime.utcnow()
+        renewed = JobLease.query.filter(
+            JobLease.name == self.name,
+            or_(JobLease.holder == self.holder, JobLease.expires_at < now)
+        ).update({JobLease.holder: self.holder, JobLease.expires_at: now + self.lease_ttl},
+                 synchronize_session=False)
+        if renewed:
+            db.session.commit()
+            return True
+
+        if db.session.get(JobLease, self.name) is not None:
+            db.session.rollback()
+            return False
+        try:
+            db.session.add(JobLease(name=self.name, holder=self.holder, expires_at=now + self.lease_ttl))
+            db.session.commit()
+        except IntegrityError:
+            # Another process created the row first
+            db.session.rollback()
+            return False
+        return True
+
+    def _release(self):
+        if self._conn is not None:
+            self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key})
+            self._conn.close()
+            self._conn = None
+        elif not self._uses_advisory_lock():
+            JobLease.query.filter_by(name=self.name, holder=self.holder).delete(synchronize_session=False)
+            db.session.commit()
+
+    def _drop_connection(self):
+        if self._conn is not None:
+            # Never hand a connection that may still hold the lock back to the pool
+            try:
+                self._conn.invalidate()
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
@@ -0,0 +1,130 @@
+"""Read throughput against the database at rising concurrency, for sizing the DB_POOL_* settings.
+
+Seeds transactions, serves app.py under gunicorn, and for each concurrency
+level keeps that many clients paging GET /transactions for --duration
+seconds. Reports latency, throughput and the connection pool's checkout
+wait as seen by one worker's /metrics.
+
+    python -m loadtest.concurrency --levels 50,200,500 --workers 4 --threads 16 \\
+        --database-url postgresql://localhost/portal_loadtest
+
+Repeat with DB_POOL_MODE=transaction and a PgBouncer URL to compare.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+import requests
+
+from loadtest.run import ROOT, percentile, wait_until
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--levels', default='50,200,500', help="comma-separated client counts")
+    parser.add_argument('--duration', type=float, default=15.0, help="seconds per level")
+    parser.add_argument('--rows', type=int, default=5000, help="transactions to seed")
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument('--threads', type=int, default=16, help="gunicorn threads per worker")
+    parser.add_argument('--port', type=int, default=5056)
+    parser.add_argument('--database-url', default=None, help="defaults to a temporary SQLite file")
+    return parser.parse_args()
+
+
+def run_level(base, token, clients, duration):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        http = requests.Session()
+        http.headers['Authorization'] = f'Bearer {token}'
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                ok = http.get(f'{base}/transactions?limit=50', timeout=30).status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                if ok:
+                    latencies.append(time.monotonic() - started)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), errors[0], time.monotonic() - started
+
+
+def main():
+    args = parse_args()
+    database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/concurrency.db"
+    os.environ.update({
+        'DATABASE_URL': database_url,
+        'ENVIRONMENT': 'loadtest',
+        'SECRET_KEY': 'loadtest-secret-key-loadtest-secret-key',
+        'BACKGROUND_JOBS': 'false',
+    })
+
+    sys.path.insert(0, ROOT)
+    from app import app
+    from models import db, User, Bundle, Transaction
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='loadtest', phone='0700000000', password_hash='x')
+        bundle = Bundle(name='loadtest-1h', data_amount='1 GB', duration='1 hours', price=10)
+        db.session.add_all([user, bundle])
+        db.session.flush()
+        db.session.bulk_insert_mappings(Transaction, [{
+            'user_id': user.id, 'bundle_id': bundle.id, 'amount': 10, 'status': 'completed',
+            'created_at': datetime.utcnow(), 'mac_address': f'02:00:00:00:{(i >> 8) & 0xFF:02X}:{i & 0xFF:02X}',
+            'ip_address': '10.0.0.1',
+        } for i in range(args.rows)])
+        db.session.commit()
+        token = create_access_token(identity=user.id)
+
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '--threads', str(args.threads),
+         '--backlog', '2048', '-b', f'127.0.0.1:{args.port}', 'app:app'],
+        cwd=ROOT, env=os.environ.copy(), stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT
+    )
+    base = f'http://127.0.0.1:{args.port}'
+    try:
+        def ready():
+            try:
+                return requests.get(f'{base}/bundles', timeout=1).status_code == 200
+            except requests.RequestException:
+                return False
+        if not wait_until(ready, 30):
+            sys.exit("gunicorn did not come up")
+
+        print(f"gunicorn {args.workers}x{args.threads}, {database_url.split(':')[0]}, "
+              f"DB_POOL_MODE={os.environ.get('DB_POOL_MODE', 'session')}")
+        print(f"{'clients':>8} {'ok':>8} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+              f"{'per sec':>9} {'wait p95':>9}")
+        for clients in (int(level) for level in args.levels.split(',')):
+            latencies, errors, elapsed = run_level(base, token, clients, args.duration)
+            ms = [s * 1000 for s in latencies] or [0.0]
+            timers = requests.get(f'{base}/metrics', headers={'Authorization': f'Bearer {token}'},
+                                  timeout=10).json()['timers']
+            wait = timers.get('db_pool_checkout_wait_seconds', {}).get('p95')
+            print(f"{clients:>8} {len(latencies):>8} {errors:>7} {percentile(ms, 50):>9.1f} "
+                  f"{percentile(ms, 95):>9.1f} {percentile(ms, 99):>9.1f} {len(latencies) / elapsed:>9.1f} "
+                  f"{'-' if wait is None else f'{wait * 1000:.1f}ms':>9}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
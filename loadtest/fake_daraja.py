@@ -0,0 +1,165 @@
+"""Local stand-in for Safaricom's Daraja OAuth and STK push APIs.
+
+An accepted STK push is answered right away. After `callback_delay`
+seconds the server posts the stkCallback to the CallBackURL in the
+request, as Safaricom does once the customer has entered their PIN.
+Latency and an error rate can be injected on the API calls, and a share
+of callbacks can be lost so that only the STK Push Query reveals them.
+"""
+import itertools
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import requests
+
+
+class DarajaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        daraja = self.server
+        if not self.path.startswith('/oauth/v1/generate'):
+            return self.reply(404, {'errorMessage': 'Not found'})
+        daraja.count('oauth')
+        daraja.delay()
+        self.reply(200, {'access_token': daraja.token, 'expires_in': str(daraja.token_ttl)})
+
+    def do_POST(self):
+        daraja = self.server
+        body = self.read_json()
+        if self.headers.get('Authorization') != f'Bearer {daraja.token}':
+            daraja.count('unauthorized')
+            return self.reply(401, {'errorCode': '404.001.03', 'errorMessage': 'Invalid Access Token'})
+
+        if self.path == '/mpesa/stkpush/v1/processrequest':
+            daraja.count('stkpush')
+            daraja.delay()
+            if daraja.fails():
+                return self.reply(500, {'errorCode': '500.001.1001', 'errorMessage': 'Injected failure'})
+            checkout_request_id = daraja.accept(body)
+            return self.reply(200, {
+                'MerchantRequestID': f'mr-{checkout_request_id}',
+                'CheckoutRequestID': checkout_request_id,
+                'ResponseCode': '0',
+                'ResponseDescription': 'Success. Request accepted for processing',
+                'CustomerMessage': 'Success. Request accepted for processing'
+            })
+
+        if self.path == '/mpesa/stkpushquery/v1/query':
+            daraja.count('stkquery')
+            daraja.delay()
+            if daraja.fails():
+                return self.reply(500, {'errorCode': '500.001.1001', 'errorMessage': 'Injected failure'})
+            result = daraja.results.get(body.get('CheckoutRequestID'))
+            if result is None:
+                return self.reply(500, {'errorCode': '500.001.1001', 'errorMessage': 'The transaction is being processed'})
+            return self.reply(200, {
+                'ResponseCode': '0',
+                'ResponseDescription': 'The service request has been accepted successsfully',
+                'MerchantRequestID': result['MerchantRequestID'],
+                'CheckoutRequestID': result['CheckoutRequestID'],
+                'ResultCode': str(result['ResultCode']),
+                'ResultDesc': result['ResultDesc'],
+            })
+
+        self.reply(404, {'errorMessage': 'Not found'})
+
+
+class FakeDaraja(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # listen backlog; the default of 5 resets bursts of concurrent connects
+
+    def __init__(self, port=0, latency=0.0, error_rate=0.0, callback_delay=0.5,
+                 callback_failure_rate=0.0, callback_loss_rate=0.0, token_ttl=3599):
+        super().__init__(('127.0.0.1', port), DarajaHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.callback_delay = callback_delay
+        self.callback_failure_rate = callback_failure_rate
+        self.callback_loss_rate = callback_loss_rate
+        self.token_ttl = token_ttl
+        self.token = 'fake-token'
+
+        self.lock = threading.Lock()
+        self.hits = {}
+        self.callback_sent_at = {}   # CheckoutRequestID -> monotonic time the callback was posted
+        self.callback_ack = {}       # CheckoutRequestID -> seconds the app took to acknowledge it
+        self.results = {}            # CheckoutRequestID -> stkCallback, once the customer has answered
+        self.lost = set()            # CheckoutRequestIDs whose callback was never sent
+        self._ids = itertools.count(1)
+        self._callbacks = ThreadPoolExecutor(max_workers=32)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def count(self, name):
+        with self.lock:
+            self.hits[name] = self.hits.get(name, 0) + 1
+
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def fails(self):
+        return self.error_rate and random.random() < self.error_rate
+
+    def accept(self, stk_request):
+        checkout_request_id = f'ws_CO_{next(self._ids):010d}'
+        self._callbacks.submit(self._send_callback, checkout_request_id, stk_request)
+        return checkout_request_id
+
+    def _send_callback(self, checkout_request_id, stk_request):
+        time.sleep(self.callback_delay)
+        if random.random() < self.callback_failure_rate:
+            stk_callback = {'ResultCode': 1032, 'ResultDesc': 'Request cancelled by user'}
+        else:
+            stk_callback = {
+                'ResultCode': 0,
+                'ResultDesc': 'The service request is processed successfully.',
+                'CallbackMetadata': {'Item': [
+                    {'Name': 'Amount', 'Value': stk_request.get('Amount')},
+                    {'Name': 'MpesaReceiptNumber', 'Value': f'R{checkout_request_id[-10:]}'},
+                    {'Name': 'TransactionDate', 'Value': int(datetime.now().strftime('%Y%m%d%H%M%S'))},
+                    {'Name': 'PhoneNumber', 'Value': stk_request.get('PhoneNumber')},
+                ]}
+            }
+        stk_callback.update(MerchantRequestID=f'mr-{checkout_request_id}', CheckoutRequestID=checkout_request_id)
+
+        sent_at = time.monotonic()
+        with self.lock:
+            self.results[checkout_request_id] = stk_callback
+            if random.random() < self.callback_loss_rate:
+                self.lost.add(checkout_request_id)
+                return
+            self.callback_sent_at[checkout_request_id] = sent_at
+        try:
+            requests.post(stk_request['CallBackURL'], json={'Body': {'stkCallback': stk_callback}}, timeout=30)
+        except requests.RequestException as e:
+            print(f"Callback for {checkout_request_id} failed: {e}")
+            return
+        with self.lock:
+            self.callback_ack[checkout_request_id] = time.monotonic() - sent_at
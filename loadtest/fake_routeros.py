@@ -0,0 +1,156 @@
+"""Minimal RouterOS API server speaking the binary API protocol on a local port.
+
+Implements just enough for RouterManager: login (plain and challenge), and
+add/print/remove on any menu path. Latency and an error rate can be injected
+per command. Add and remove times are recorded per MAC for latency reports.
+"""
+import random
+import socketserver
+import threading
+import time
+
+
+def encode_length(length):
+    if length < 0x80:
+        return bytes([length])
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, 'big')
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, 'big')
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, 'big')
+    return b'\xf0' + length.to_bytes(4, 'big')
+
+
+def read_length(stream):
+    first = stream.read(1)
+    if not first:
+        raise EOFError
+    c = first[0]
+    if c < 0x80:
+        return c
+    if c < 0xC0:
+        return ((c & 0x3F) << 8) | stream.read(1)[0]
+    if c < 0xE0:
+        return ((c & 0x1F) << 16) | int.from_bytes(stream.read(2), 'big')
+    if c < 0xF0:
+        return ((c & 0x0F) << 24) | int.from_bytes(stream.read(3), 'big')
+    return int.from_bytes(stream.read(4), 'big')
+
+
+class RouterOsHandler(socketserver.StreamRequestHandler):
+    def read_sentence(self):
+        words = []
+        while True:
+            length = read_length(self.rfile)
+            if length == 0:
+                return words
+            words.append(self.rfile.read(length).decode())
+
+    def send(self, *sentences):
+        out = b''
+        for words in sentences:
+            out += b''.join(encode_length(len(w)) + w for w in (w.encode() for w in words)) + b'\x00'
+        self.wfile.write(out)
+
+    def handle(self):
+        router = self.server
+        with router.lock:
+            router.connections += 1
+        while True:
+            try:
+                words = self.read_sentence()
+            except (EOFError, ConnectionError, OSError):
+                return
+            if not words:
+                continue
+
+            command, attrs, queries, tag = words[0], {}, {}, []
+            for word in words[1:]:
+                if word.startswith('.tag='):
+                    tag = [word]
+                elif word.startswith('?'):
+                    key, _, value = word[1:].partition('=')
+                    queries[key] = value
+                elif word.startswith('='):
+                    key, _, value = word[1:].partition('=')
+                    attrs[key] = value
+
+            if command == '/login':
+                if 'name' in attrs:
+                    self.send(['!done'] + tag)
+                else:
+                    self.send(['!done', '=ret=' + '00' * 16] + tag)
+                continue
+
+            if router.latency:
+                time.sleep(router.latency)
+            if router.error_rate and random.random() < router.error_rate:
+                self.send(['!trap', '=message=injected failure'] + tag, ['!done'] + tag)
+                continue
+            self.send(*router.execute(command, attrs, queries, tag))
+
+
+class FakeRouterOS(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    request_queue_size = 128  # listen backlog; the default of 5 resets bursts of concurrent connects
+    allow_reuse_address = True
+
+    def __init__(self, port=0, latency=0.0, error_rate=0.0):
+        super().__init__(('127.0.0.1', port), RouterOsHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.tables = {}
+        self.next_id = 0
+        self.connections = 0
+        self.commands = {}
+        self.added_at = {}    # MAC -> monotonic time the binding was added
+        self.removed_at = {}  # MAC -> monotonic time the binding was removed
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def execute(self, command, attrs, queries, tag):
+        path, _, verb = command.rpartition('/')
+        now = time.monotonic()
+        with self.lock:
+            self.commands[command] = self.commands.get(command, 0) + 1
+            table = self.tables.setdefault(path, {})
+
+            if verb == 'add':
+                self.next_id += 1
+                row_id = f'*{self.next_id:X}'
+                table[row_id] = dict(attrs, **{'.id': row_id})
+                if 'mac-address' in attrs:
+                    self.added_at[attrs['mac-address'].upper()] = now
+                return [['!done', f'=ret={row_id}'] + tag]
+
+            if verb == 'print':
+                if path == '/system/identity':
+                    rows = [{'name': 'fake-routeros'}]
+                else:
+                    rows = [row for row in table.values()
+                            if all(row.get(k) == v for k, v in queries.items())]
+                proplist = attrs.get('.proplist')
+                if proplist:
+                    keys = proplist.split(',')
+                    rows = [{k: row[k] for k in keys if k in row} for row in rows]
+                replies = [['!re'] + [f'={k}={v}' for k, v in row.items()] + tag for row in rows]
+                return replies + [['!done'] + tag]
+
+            if verb == 'remove':
+                for row_id in attrs.get('.id', attrs.get('numbers', '')).split(','):
+                    row = table.pop(row_id, None)
+                    if row is None:
+                        return [['!trap', '=message=no such item'] + tag, ['!done'] + tag]
+                    if 'mac-address' in row:
+                        self.removed_at[row['mac-address'].upper()] = now
+                return [['!done'] + tag]
+
+        return [['!trap', f'=message=no such command {command}'] + tag, ['!done'] + tag]
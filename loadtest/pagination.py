@@ -0,0 +1,104 @@
+"""Time to serve one page of GET /transactions at growing depth, OFFSET against keyset.
+
+Seeds --rows transactions (1M by default) and, for each depth, times the
+listing query of resources/transaction.py fetching --limit rows:
+
+  offset  ORDER BY id DESC LIMIT n OFFSET depth, which reads and discards
+          every row before the page
+  keyset  WHERE id < cursor ORDER BY id DESC LIMIT n, what keyset_page runs
+
+and, once, the unpaged listing every request used to build (--skip-full
+to leave it out).
+
+    python -m loadtest.pagination --rows 1000000 --database-url postgresql://localhost/portal_bench
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from loadtest.run import ROOT
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--depths', default='0,1000,10000,100000,500000,900000',
+                        help="comma-separated numbers of rows before the page")
+    parser.add_argument('--repeat', type=int, default=5, help="best of this many runs")
+    parser.add_argument('--skip-full', action='store_true', help="don't time the unpaged listing")
+    parser.add_argument('--database-url', default=None, help="defaults to a temporary SQLite file")
+    return parser.parse_args()
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), rows
+
+
+def main():
+    args = parse_args()
+    os.environ.update({
+        'DATABASE_URL': args.database_url or f"sqlite:///{tempfile.mkdtemp()}/pagination.db",
+        'SECRET_KEY': 'loadtest-secret-key-loadtest-secret-key',
+        'BACKGROUND_JOBS': 'false',
+        'SQL_SLOW_QUERY_MS': '60000',  # the seeding inserts would all be logged
+    })
+
+    sys.path.insert(0, ROOT)
+    from app import app
+    from models import db, Bundle, Transaction
+    from resources.pagination import keyset_page
+    from resources.serializers import TRANSACTION_LISTING
+
+    with app.app_context():
+        db.create_all()
+        bundle = Bundle(name='pagination', data_amount='1 GB', duration='1 hours', price=10)
+        db.session.add(bundle)
+        db.session.commit()
+
+        seeded = time.perf_counter()
+        start = datetime(2025, 1, 1)
+        for offset in range(0, args.rows, 50000):
+            db.session.execute(db.insert(Transaction), [{
+                'bundle_id': bundle.id, 'amount': 10, 'status': 'completed',
+                'mpesa_code': f'PAG{i:09d}', 'mac_address': '02:00:00:00:00:01', 'ip_address': '10.0.0.1',
+                'created_at': start + timedelta(seconds=i),
+            } for i in range(offset, min(offset + 50000, args.rows))])
+            db.session.commit()
+        print(f"Seeded {args.rows} transactions in {time.perf_counter() - seeded:.1f}s")
+
+        top = db.session.query(db.func.max(Transaction.id)).scalar()
+        depths = [int(depth) for depth in args.depths.split(',') if int(depth) < args.rows]
+
+        print(f"{'depth':>8} {'offset ms':>10} {'keyset ms':>10} {'speedup':>8}")
+        for depth in depths:
+            def offset_page():
+                return TRANSACTION_LISTING.query().order_by(Transaction.id.desc()) \
+                    .offset(depth).limit(args.limit).all()
+
+            def keyset():
+                # The cursor a client holds after paging down to `depth`; ids are contiguous here
+                cursor = top - depth + 1 if depth else None
+                return keyset_page(TRANSACTION_LISTING.query(), Transaction.id, args.limit, cursor)[0]
+
+            offset_time, offset_rows = best_of(args.repeat, offset_page)
+            keyset_time, keyset_rows = best_of(args.repeat, keyset)
+            assert [row.id for row in offset_rows] == [row.id for row in keyset_rows]
+            print(f"{depth:>8} {offset_time * 1000:>10.2f} {keyset_time * 1000:>10.2f} "
+                  f"{offset_time / keyset_time:>7.1f}x")
+
+        if not args.skip_full:
+            full_time, rows = best_of(1, lambda: TRANSACTION_LISTING.dump_many(TRANSACTION_LISTING.query().all()))
+            print(f"unpaged listing: {len(rows)} rows in {full_time * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
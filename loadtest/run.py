@@ -0,0 +1,231 @@
+"""End-to-end load test of the purchase path against local Daraja and RouterOS stand-ins.
+
+Starts a fake Daraja server and a fake RouterOS API server, serves app.py
+under gunicorn, and drives concurrent purchases through every stage:
+
+    stkpush    POST /mpesa/stkpush, client-observed latency
+    callback   Daraja's POST /mpesa/callback, time until the app acknowledged it
+    authorize  callback sent -> ip-binding added on the router
+    reconcile  lost callbacks (--callback-loss-rate): reconciler start -> ip-binding added
+    revoke     sweep start -> ip-binding removed, once every session has expired
+
+Run from the repository root:
+
+    python -m loadtest.run --purchases 500 --concurrency 50 --workers 4 --threads 8
+
+Point --database-url at a scratch Postgres to size production hardware;
+the default SQLite file serialises writers and shows its own limits first.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+from loadtest.fake_daraja import FakeDaraja
+from loadtest.fake_routeros import FakeRouterOS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, pct):
+    return samples[min(len(samples) - 1, len(samples) * pct // 100)]
+
+
+def report(name, samples, errors, elapsed):
+    samples = sorted(samples)
+    if not samples:
+        print(f"{name:<10} {0:>6} {errors:>7}")
+        return
+    ms = [s * 1000 for s in samples]
+    print(f"{name:<10} {len(samples):>6} {errors:>7} {percentile(ms, 50):>9.1f} {percentile(ms, 95):>9.1f} "
+          f"{percentile(ms, 99):>9.1f} {len(samples) / elapsed:>10.1f}")
+
+
+def wait_until(predicate, timeout, interval=0.1):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return False
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--purchases', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20, help="purchases in flight at once")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--database-url', default=None, help="defaults to a temporary SQLite file")
+    parser.add_argument('--daraja-latency', type=float, default=0.05)
+    parser.add_argument('--daraja-error-rate', type=float, default=0.0)
+    parser.add_argument('--callback-delay', type=float, default=0.5, help="seconds from STK push to callback")
+    parser.add_argument('--callback-failure-rate', type=float, default=0.0, help="share of cancelled payments")
+    parser.add_argument('--callback-loss-rate', type=float, default=0.0,
+                        help="share of callbacks never delivered, left to the STK query reconciler")
+    parser.add_argument('--router-latency', type=float, default=0.01)
+    parser.add_argument('--router-error-rate', type=float, default=0.0)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    daraja = FakeDaraja(latency=args.daraja_latency, error_rate=args.daraja_error_rate,
+                        callback_delay=args.callback_delay,
+                        callback_failure_rate=args.callback_failure_rate,
+                        callback_loss_rate=args.callback_loss_rate).start()
+    router = FakeRouterOS(latency=args.router_latency, error_rate=args.router_error_rate).start()
+
+    database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/loadtest.db"
+    os.environ.update({
+        'DATABASE_URL': database_url,
+        'ENVIRONMENT': 'loadtest',
+        'SECRET_KEY': 'loadtest-secret-key-loadtest-secret-key',
+        'MPESA_BASE_URL': daraja.base_url,
+        'MPESA_CONSUMER_KEY': 'key',
+        'MPESA_CONSUMER_SECRET': 'secret',
+        'MPESA_SHORTCODE': '174379',
+        'MPESA_PASSKEY': 'passkey',
+        'BASE_URL': f'http://127.0.0.1:{args.port}',
+        'MIKROTIK_HOST': '127.0.0.1',
+        'MIKROTIK_API_PORT': str(router.port),
+        'MIKROTIK_USERNAME': 'admin',
+        'MIKROTIK_PASSWORD': 'admin',
+        # The revoke stage runs the sweep itself
+        'BACKGROUND_JOBS': 'false',
+        # Every purchase comes from one IP and phone
+        'RATELIMIT_ENABLED': 'false',
+    })
+
+    sys.path.insert(0, ROOT)
+    from app import app
+    from models import db, User, Bundle, Transaction, MpesaCallback
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='loadtest', phone='0700000000', password_hash='x')
+        bundle = Bundle(name='loadtest-1h', data_amount='1 GB', duration='1 hours', price=10)
+        db.session.add_all([user, bundle])
+        db.session.commit()
+        token = create_access_token(identity=user.id)
+        plan = bundle.name
+
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '--threads', str(args.threads),
+         '-b', f'127.0.0.1:{args.port}', 'app:app'],
+        cwd=ROOT, env=os.environ.copy(), stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT
+    )
+    base = f'http://127.0.0.1:{args.port}'
+    try:
+        def ready():
+            try:
+                return requests.get(f'{base}/bundles', timeout=1).status_code == 200
+            except requests.RequestException:
+                return False
+        if not wait_until(ready, 30):
+            sys.exit("gunicorn did not come up")
+
+        # Stage 1: STK push
+        checkout_macs = {}
+        stk_latency, stk_errors = [], 0
+        http = requests.Session()
+        http.headers['Authorization'] = f'Bearer {token}'
+
+        def purchase(i):
+            mac = f'02:00:00:{(i >> 16) & 0xFF:02X}:{(i >> 8) & 0xFF:02X}:{i & 0xFF:02X}'
+            started = time.monotonic()
+            response = http.post(f'{base}/mpesa/stkpush', json={
+                'phone': '0700000000', 'amount': 10, 'plan': plan,
+                'mac_address': mac, 'ip_address': f'10.{(i >> 16) & 0xFF}.{(i >> 8) & 0xFF}.{i & 0xFF}'
+            }, timeout=60)
+            return mac, time.monotonic() - started, response
+
+        stk_started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for mac, latency, response in pool.map(purchase, range(args.purchases)):
+                if response.status_code == 200:
+                    stk_latency.append(latency)
+                    checkout_macs[response.json()['CheckoutRequestID']] = mac
+                else:
+                    stk_errors += 1
+        stk_elapsed = time.monotonic() - stk_started
+
+        # Stages 2 and 3: callbacks and router authorization
+        wait_until(lambda: len(daraja.results) >= len(checkout_macs)
+                   and len(daraja.callback_ack) >= len(checkout_macs) - len(daraja.lost), args.timeout)
+
+        def drained():
+            with app.app_context():
+                return not MpesaCallback.query.filter(MpesaCallback.status.in_(['pending', 'processing'])).count()
+        wait_until(drained, args.timeout, interval=0.5)
+
+        callback_latency = list(daraja.callback_ack.values())
+        authorize_latency = [
+            router.added_at[mac] - daraja.callback_sent_at[checkout]
+            for checkout, mac in checkout_macs.items()
+            if mac in router.added_at and checkout in daraja.callback_sent_at
+        ]
+        sent = sorted(daraja.callback_sent_at.values())
+        callback_elapsed = (max(sent) - min(sent)) if len(sent) > 1 else 1.0
+        authorized = [router.added_at[mac] for mac in checkout_macs.values() if mac in router.added_at]
+        authorize_elapsed = (max(authorized) - min(sent)) if authorized else 1.0
+
+        # Stage 4: settle lost callbacks through the STK query reconciler
+        reconcile_latency, reconcile_errors, reconcile_elapsed = [], 0, 1.0
+        if daraja.lost:
+            from reconciler import pending_reconciler
+            pending_reconciler.min_age = timedelta(0)
+            reconcile_started = time.monotonic()
+            pending_reconciler.run(app)
+            wait_until(drained, args.timeout, interval=0.5)
+            reconcile_elapsed = time.monotonic() - reconcile_started
+            lost_macs = [checkout_macs[checkout] for checkout in daraja.lost if checkout in checkout_macs]
+            reconcile_latency = [router.added_at[mac] - reconcile_started for mac in lost_macs if mac in router.added_at]
+            reconcile_errors = sum(1 for checkout in daraja.lost if daraja.results[checkout]['ResultCode'] == 0) \
+                - len(reconcile_latency)
+
+        # Stage 5: revocation sweep over every completed session
+        with app.app_context():
+            completed = Transaction.query.filter_by(status='completed').count()
+            failed_authorization = Transaction.query.filter_by(status='failed_authorization').count()
+            Transaction.query.filter_by(status='completed').update(
+                {Transaction.expires_at: db.func.datetime('now', '-1 minute')}
+                if database_url.startswith('sqlite') else
+                {Transaction.expires_at: db.text("now() at time zone 'utc' - interval '1 minute'")},
+                synchronize_session=False
+            )
+            db.session.commit()
+
+        from scheduler import cleanup_expired_sessions
+        revoke_started = time.monotonic()
+        cleanup_expired_sessions(app)
+        revoke_elapsed = time.monotonic() - revoke_started
+        revoke_latency = [router.removed_at[mac] - revoke_started
+                          for mac in checkout_macs.values() if mac in router.removed_at]
+
+        print()
+        print(f"{args.purchases} purchases, concurrency {args.concurrency}, "
+              f"gunicorn {args.workers}x{args.threads}, {database_url.split(':')[0]}")
+        print(f"{'stage':<10} {'ok':>6} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'per sec':>10}")
+        report('stkpush', stk_latency, stk_errors, stk_elapsed)
+        report('callback', callback_latency, len(checkout_macs) - len(callback_latency), callback_elapsed)
+        report('authorize', authorize_latency, failed_authorization, authorize_elapsed)
+        if daraja.lost:
+            report('reconcile', reconcile_latency, reconcile_errors, reconcile_elapsed)
+        report('revoke', revoke_latency, completed - len(revoke_latency), revoke_elapsed)
+        print(f"\nDaraja calls: {daraja.hits}; router connections: {router.connections}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
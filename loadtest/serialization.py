@@ -0,0 +1,93 @@
+"""Rows per second for building a large transaction listing, before and after resources/serializers.py.
+
+Seeds --rows transactions and times, for the same rows:
+
+  orm     ORM instances, a hand-built dict per row with .isoformat()/str(),
+          encoded with the stdlib json module (the old resource code)
+  schema  column tuples through a Schema, encoded with serializers.dumps
+          (orjson when installed)
+
+    python -m loadtest.serialization --rows 100000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from loadtest.run import ROOT
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3, help="best of this many runs")
+    parser.add_argument('--database-url', default=None, help="defaults to a temporary SQLite file")
+    return parser.parse_args()
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(func())
+        timings.append(time.perf_counter() - started)
+    return min(timings), size
+
+
+def main():
+    args = parse_args()
+    os.environ.update({
+        'DATABASE_URL': args.database_url or f"sqlite:///{tempfile.mkdtemp()}/serialization.db",
+        'SECRET_KEY': 'loadtest-secret-key-loadtest-secret-key',
+        'BACKGROUND_JOBS': 'false',
+    })
+
+    sys.path.insert(0, ROOT)
+    from app import app
+    from models import db, Bundle, Transaction
+    from resources.serializers import TRANSACTION, dumps, orjson
+
+    with app.app_context():
+        db.create_all()
+        bundle = Bundle(name='serialization', data_amount='1 GB', duration='1 hours', price=10)
+        db.session.add(bundle)
+        db.session.commit()
+        db.session.execute(db.insert(Transaction), [{
+            'bundle_id': bundle.id, 'user_id': None, 'amount': 10, 'status': 'completed',
+            'mpesa_code': f'SER{i:08d}', 'mac_address': '02:00:00:00:00:01', 'ip_address': '10.0.0.1',
+            'created_at': datetime(2025, 1, 1 + i % 28, i % 24, i % 60, i % 60, i),
+        } for i in range(args.rows)])
+        db.session.commit()
+
+        def orm():
+            transactions = Transaction.query.limit(args.rows).all()
+            body = json.dumps([{
+                "id": transaction.id,
+                "user_id": transaction.user_id,
+                "bundle_id": transaction.bundle_id,
+                "mpesa_code": transaction.mpesa_code,
+                "amount": str(transaction.amount),
+                "status": transaction.status,
+                "created_at": transaction.created_at.isoformat()
+            } for transaction in transactions])
+            db.session.expunge_all()
+            return body
+
+        def schema():
+            return dumps(TRANSACTION.dump_many(TRANSACTION.query().limit(args.rows)))
+
+        print(f"{args.rows} rows, encoder: {'orjson' if orjson else 'json'}")
+        print(f"{'path':<8} {'seconds':>8} {'rows/s':>10} {'bytes':>10}")
+        results = {}
+        for name, func in (('orm', orm), ('schema', schema)):
+            elapsed, size = best_of(args.repeat, func)
+            results[name] = elapsed
+            print(f"{name:<8} {elapsed:8.3f} {args.rows / elapsed:10.0f} {size:10d}")
+        print(f"speedup  {results['orm'] / results['schema']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import threading
+from collections import deque
+
+
+class Metrics:
+    """In-process counters, timers and gauges, read back through /metrics.
+
+    Timers keep count, total and max plus a bounded sample of recent values
+    for percentiles, so memory stays constant however long the process runs.
+    """
+
+    def __init__(self, sample_size=1024):
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._timers = {}
+        self._gauges = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = self._timers[name] = {
+                    'count': 0, 'total': 0.0, 'max': 0.0, 'samples': deque(maxlen=self.sample_size)
+                }
+            timer['count'] += 1
+            timer['total'] += seconds
+            timer['max'] = max(timer['max'], seconds)
+            timer['samples'].append(seconds)
+
+    def gauge(self, name, func):
+        """Registers a callable that is read each time a snapshot is taken."""
+        with self._lock:
+            self._gauges[name] = func
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            timers = {name: dict(timer, samples=sorted(timer['samples'])) for name, timer in self._timers.items()}
+            gauges = dict(self._gauges)
+
+        for name, timer in timers.items():
+            samples = timer.pop('samples')
+            timer['avg'] = timer['total'] / timer['count']
+            for pct in (50, 95, 99):
+                timer[f'p{pct}'] = samples[min(len(samples) - 1, len(samples) * pct // 100)]
+
+        return {
+            'counters': counters,
+            'timers': timers,
+            'gauges': {name: func() for name, func in gauges.items()},
+        }
+
+
+metrics = Metrics()
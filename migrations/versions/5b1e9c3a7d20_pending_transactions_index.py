@@ -0,0 +1,35 @@
+"""pending transactions index
+
+Partial index on the age of pending purchases, for the STK query
+reconciler. Built CONCURRENTLY on Postgres, like the hot lookup indexes.
+
+Revision ID: 5b1e9c3a7d20
+Revises: 6d8f676f4932
+Create Date: 2026-10-17 22:52:06.318415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e9c3a7d20'
+down_revision = '6d8f676f4932'
+branch_labels = None
+depends_on = None
+
+PENDING = sa.text("status = 'pending'")
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index('ix_transactions_pending_created_at', 'transactions', ['created_at'], unique=False,
+                        if_not_exists=True, postgresql_concurrently=True,
+                        postgresql_where=PENDING, sqlite_where=PENDING)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_transactions_pending_created_at', table_name='transactions', if_exists=True,
+                      postgresql_concurrently=True)
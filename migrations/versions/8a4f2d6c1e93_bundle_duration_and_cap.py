@@ -0,0 +1,96 @@
+"""bundle duration and cap
+
+Adds the parsed bundles.duration_seconds and bundles.data_cap_bytes and
+fills them for existing bundles with the parsers the model's validators
+use, frozen here as they were. A bundle whose strings do not parse is
+left NULL and reported.
+
+Revision ID: 8a4f2d6c1e93
+Revises: 5b1e9c3a7d20
+Create Date: 2026-10-17 22:58:41.207133
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4f2d6c1e93'
+down_revision = '5b1e9c3a7d20'
+branch_labels = None
+depends_on = None
+
+DURATION_UNITS = {
+    'second': 1, 'sec': 1, 's': 1,
+    'minute': 60, 'min': 60, 'm': 60,
+    'hour': 3600, 'hr': 3600, 'h': 3600,
+    'day': 86400, 'd': 86400,
+    'week': 604800, 'wk': 604800, 'w': 604800,
+    'month': 2592000,  # 30 days
+}
+
+DATA_UNITS = {'b': 1, 'kb': 1024, 'mb': 1024 ** 2, 'gb': 1024 ** 3, 'tb': 1024 ** 4}
+
+
+def parse_duration(text):
+    """Seconds in a duration such as "24 hours", "30 min" or "1 week"; a bare number is hours."""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*', text or '')
+    if not match:
+        raise ValueError(f"Invalid duration: {text!r}")
+    amount, unit = float(match.group(1)), match.group(2).lower()
+    if not unit:
+        return int(amount * 3600)
+    if unit not in DURATION_UNITS and unit.endswith('s'):
+        unit = unit[:-1]
+    if unit not in DURATION_UNITS:
+        raise ValueError(f"Unknown duration unit in {text!r}")
+    return int(amount * DURATION_UNITS[unit])
+
+
+def parse_data_amount(text):
+    """Bytes in a data allowance such as "1 GB" or "500MB"; None for "Unlimited"."""
+    if (text or '').strip().lower() == 'unlimited':
+        return None
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)\s*', text or '')
+    if not match or match.group(2).lower() not in DATA_UNITS:
+        raise ValueError(f"Invalid data amount: {text!r}")
+    return int(float(match.group(1)) * DATA_UNITS[match.group(2).lower()])
+
+
+bundles = sa.table(
+    'bundles',
+    sa.column('id', sa.Integer),
+    sa.column('name', sa.String),
+    sa.column('duration', sa.String),
+    sa.column('data_amount', sa.String),
+    sa.column('duration_seconds', sa.Integer),
+    sa.column('data_cap_bytes', sa.BigInteger),
+)
+
+
+def upgrade():
+    with op.batch_alter_table('bundles', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('duration_seconds', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('data_cap_bytes', sa.BigInteger(), nullable=True))
+
+    if op.get_context().as_sql:
+        # There are no rows to read when only printing the SQL; upgrade the database itself to backfill
+        return
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(bundles.c.id, bundles.c.name, bundles.c.duration, bundles.c.data_amount))
+    for bundle in rows.all():
+        try:
+            values = {'duration_seconds': parse_duration(bundle.duration),
+                      'data_cap_bytes': parse_data_amount(bundle.data_amount)}
+        except ValueError as e:
+            print(f"Bundle {bundle.id} ({bundle.name}) needs fixing by hand: {e}")
+            continue
+        connection.execute(bundles.update().where(bundles.c.id == bundle.id).values(**values))
+
+
+def downgrade():
+    with op.batch_alter_table('bundles', schema=None) as batch_op:
+        batch_op.drop_column('data_cap_bytes')
+        batch_op.drop_column('duration_seconds')
@@ -0,0 +1,50 @@
+"""hot lookup indexes
+
+Indexes the callback lookup, the expiry sweep, the per-user listings,
+router reconciliation by MAC, the STK push plan lookup and the callback
+resume scan. On Postgres each index is built CONCURRENTLY, outside a
+transaction, so the live tables keep taking writes while it builds.
+
+Revision ID: bc8e10fa5f10
+Revises: d3e446343082
+Create Date: 2026-10-17 22:38:28.442764
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bc8e10fa5f10'
+down_revision = 'd3e446343082'
+branch_labels = None
+depends_on = None
+
+COMPLETED = "status = 'completed'"
+
+# (name, table, columns, partial index predicate)
+INDEXES = [
+    ('ix_transactions_checkout_request_id', 'transactions', ['checkout_request_id'], None),
+    ('ix_transactions_completed_expires_at', 'transactions', ['expires_at'], COMPLETED),
+    ('ix_transactions_user_id_id', 'transactions', ['user_id', 'id'], None),
+    ('ix_transactions_mac_address', 'transactions', ['mac_address'], None),
+    ('ix_sessions_user_id_id', 'sessions', ['user_id', 'id'], None),
+    ('ix_sessions_transaction_id', 'sessions', ['transaction_id'], None),
+    ('ix_bundles_name', 'bundles', ['name'], None),
+    ('ix_mpesa_callbacks_status', 'mpesa_callbacks', ['status'], None),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            where = sa.text(where) if where else None
+            op.create_index(name, table, columns, unique=False, if_not_exists=True,
+                            postgresql_concurrently=True, postgresql_where=where, sqlite_where=where)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
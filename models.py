@@ -1,9 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import MetaData, Numeric
 from sqlalchemy.orm import validates, relationship
-from sqlalchemy_serializer import SerializerMixin
 from datetime import datetime
-from flask_bcrypt import generate_password_hash, check_password_hash
+from hashing import password_hasher
 import re
 
 convention = {
@@ -25,7 +24,7 @@ class User(db.Model):
     phone = db.Column(db.String(20), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True)
     password_hash = db.Column(db.String(255), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.now(), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
 
     # relationships
     transactions = db.relationship("Transaction", backref="user", lazy=True)
@@ -53,10 +52,14 @@ class User(db.Model):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password).decode('utf8')
+        # Runs on the bounded hashing pool; raises HasherBusy when it is full
+        self.password_hash = password_hasher.hash(password)
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
 
     @staticmethod
     def validate_password(password):
@@ -64,37 +67,134 @@ class User(db.Model):
             return False, "Password must be at least 8 characters"
         return True, ""
     
-class Bundle(db.Model, SerializerMixin):
+DURATION_UNITS = {
+    'second': 1, 'sec': 1, 's': 1,
+    'minute': 60, 'min': 60, 'm': 60,
+    'hour': 3600, 'hr': 3600, 'h': 3600,
+    'day': 86400, 'd': 86400,
+    'week': 604800, 'wk': 604800, 'w': 604800,
+    'month': 2592000,  # 30 days
+}
+
+DATA_UNITS = {'b': 1, 'kb': 1024, 'mb': 1024 ** 2, 'gb': 1024 ** 3, 'tb': 1024 ** 4}
+
+def parse_duration(text):
+    """Seconds in a duration such as "24 hours", "30 min" or "1 week"; a bare number is hours."""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*', text or '')
+    if not match:
+        raise ValueError(f"Invalid duration: {text!r}")
+    amount, unit = float(match.group(1)), match.group(2).lower()
+    if not unit:
+        return int(amount * 3600)
+    if unit not in DURATION_UNITS and unit.endswith('s'):
+        unit = unit[:-1]
+    if unit not in DURATION_UNITS:
+        raise ValueError(f"Unknown duration unit in {text!r}")
+    return int(amount * DURATION_UNITS[unit])
+
+def parse_data_amount(text):
+    """Bytes in a data allowance such as "1 GB" or "500MB"; None for "Unlimited"."""
+    if (text or '').strip().lower() == 'unlimited':
+        return None
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)\s*', text or '')
+    if not match or match.group(2).lower() not in DATA_UNITS:
+        raise ValueError(f"Invalid data amount: {text!r}")
+    return int(float(match.group(1)) * DATA_UNITS[match.group(2).lower()])
+
+class Bundle(db.Model):
     __tablename__ = "bundles"
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)  # STK push looks plans up by name
     data_amount = db.Column(db.String(50), nullable=False)  # e.g., "1 GB", "5 GB"
     duration = db.Column(db.String(50), nullable=False)
     price = db.Column(Numeric(10, 2), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.now(), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    # Parsed from the strings above when they are written
+    duration_seconds = db.Column(db.Integer, nullable=True)
+    data_cap_bytes = db.Column(db.BigInteger, nullable=True)  # NULL = unlimited
 
     # relationships
     transactions = db.relationship("Transaction", backref="bundle", lazy=True)
 
     def __repr__(self):
         return f"<Bundle {self.name}>"
+
+    @validates('duration')
+    def validate_duration(self, key, duration):
+        self.duration_seconds = parse_duration(duration)
+        return duration
+
+    @validates('data_amount')
+    def validate_data_amount(self, key, data_amount):
+        self.data_cap_bytes = parse_data_amount(data_amount)
+        return data_amount
     
+class Router(db.Model):
+    __tablename__ = "routers"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)  # site name sent by the portal
+    host = db.Column(db.String(255), nullable=False)
+    api_port = db.Column(db.Integer, default=8728, nullable=False)
+    username = db.Column(db.String(100), nullable=False)
+    password = db.Column(db.String(255), nullable=True)  # NULL uses MIKROTIK_PASSWORD
+    max_sessions = db.Column(db.Integer, nullable=True)  # NULL uses MIKROTIK_MAX_SESSIONS
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<Router {self.name} - {self.host}>"
+
 class Transaction(db.Model):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Per-user listing, newest first: keyset pages read straight off the index
+        db.Index('ix_transactions_user_id_id', 'user_id', 'id'),
+        # Expiry sweep: only completed rows are ever scanned by expires_at
+        db.Index(
+            'ix_transactions_completed_expires_at', 'expires_at',
+            postgresql_where=db.text("status = 'completed'"),
+            sqlite_where=db.text("status = 'completed'")
+        ),
+        # Reconciler: pending rows by age
+        db.Index(
+            'ix_transactions_pending_created_at', 'created_at',
+            postgresql_where=db.text("status = 'pending'"),
+            sqlite_where=db.text("status = 'pending'")
+        ),
+        # Archival: finished rows by age
+        db.Index(
+            'ix_transactions_terminal_created_at', 'created_at',
+            postgresql_where=db.text("status IN ('expired', 'failed', 'failed_authorization', 'capped')"),
+            sqlite_where=db.text("status IN ('expired', 'failed', 'failed_authorization', 'capped')")
+        ),
+        # Rollup catch-up: settled rows not yet counted in the report tables
+        db.Index(
+            'ix_transactions_not_rolled_up', 'id',
+            postgresql_where=db.text("NOT rolled_up AND status <> 'pending'"),
+            sqlite_where=db.text("NOT rolled_up AND status <> 'pending'")
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     bundle_id = db.Column(db.Integer, db.ForeignKey('bundles.id'), nullable=False)
     mpesa_code = db.Column(db.String(100), unique=True, nullable=True)
     amount = db.Column(Numeric(10, 2), nullable=False)
-    status = db.Column(db.String(50), nullable=False)  # e.g., 'pending', 'completed', 'failed'
-    checkout_request_id = db.Column(db.String(100), nullable=True)
+    status = db.Column(db.String(50), nullable=False)  # e.g., 'pending', 'completed', 'failed', 'capped'
+    checkout_request_id = db.Column(db.String(100), nullable=True, index=True)  # callback lookup
     transaction_date = db.Column(db.String(50), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.now(), nullable=False)
-    mac_address = db.Column(db.String(17), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    mac_address = db.Column(db.String(17), nullable=False, index=True)  # router reconciliation
     ip_address = db.Column(db.String(15), nullable=False)
     expires_at = db.Column(db.DateTime, nullable=True)  # To track when access should end
+    router_id = db.Column(db.Integer, db.ForeignKey('routers.id'), nullable=True, index=True)  # site; NULL = MIKROTIK_HOST
+    bytes_used = db.Column(db.BigInteger, default=0, server_default='0', nullable=False)  # metered by usage.py
+    last_bytes_in = db.Column(db.BigInteger, nullable=True)  # router host counters at the last usage reading
+    last_bytes_out = db.Column(db.BigInteger, nullable=True)
+    settled_at = db.Column(db.DateTime, nullable=True)  # UTC; when the callback left 'pending'
+    rolled_up = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)  # counted in the rollups
     session = db.relationship("Session", backref="transaction", uselist=False)
 
     def __repr__(self):
@@ -106,17 +206,105 @@ class Transaction(db.Model):
     def update_status(self, new_status):
         self.status = new_status
         db.session.commit()
-    
+
+class TransactionArchive(db.Model):
+    __tablename__ = "transactions_archive"
+    # Monthly range partitions on Postgres, created by archive.py as rows arrive; a plain table elsewhere
+    __table_args__ = {'postgresql_partition_by': 'RANGE (created_at)'}
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # the id it had in transactions
+    created_at = db.Column(db.DateTime, primary_key=True)  # partition key, so part of the primary key
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    bundle_id = db.Column(db.Integer, nullable=False)
+    mpesa_code = db.Column(db.String(100), nullable=True)
+    amount = db.Column(Numeric(10, 2), nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    checkout_request_id = db.Column(db.String(100), nullable=True)
+    transaction_date = db.Column(db.String(50), nullable=True)
+    mac_address = db.Column(db.String(17), nullable=False)
+    ip_address = db.Column(db.String(15), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    router_id = db.Column(db.Integer, nullable=True)
+    bytes_used = db.Column(db.BigInteger, nullable=False)
+    last_bytes_in = db.Column(db.BigInteger, nullable=True)
+    last_bytes_out = db.Column(db.BigInteger, nullable=True)
+    settled_at = db.Column(db.DateTime, nullable=True)
+    rolled_up = db.Column(db.Boolean, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<TransactionArchive {self.id} - {self.status}>"
+
+class UsageSample(db.Model):
+    __tablename__ = "usage_samples"
+    __table_args__ = (
+        db.Index('ix_usage_samples_transaction_id_sampled_at', 'transaction_id', 'sampled_at'),
+    )
+
+    # Append-only; one row per transaction per collector pass that saw traffic
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=False)
+    sampled_at = db.Column(db.DateTime, nullable=False)
+    bytes_in = db.Column(db.BigInteger, nullable=False)   # increase since the previous sample
+    bytes_out = db.Column(db.BigInteger, nullable=False)
+
+    def __repr__(self):
+        return f"<UsageSample {self.transaction_id} @ {self.sampled_at}>"
+
+class RollupMixin:
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.DateTime, nullable=False)  # start of the hour or day, UTC
+    bundle_id = db.Column(db.Integer, nullable=False)
+    router_id = db.Column(db.Integer, nullable=False)  # 0 = MIKROTIK_HOST
+    status = db.Column(db.String(50), nullable=False)  # outcome at settlement
+    transactions = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(Numeric(14, 2), default=0, nullable=False)
+    bytes_used = db.Column(db.BigInteger, default=0, nullable=False)
+
+class HourlyRollup(RollupMixin, db.Model):
+    __tablename__ = "rollups_hourly"
+    __table_args__ = (db.UniqueConstraint('bucket', 'bundle_id', 'router_id', 'status'),)
+
+    def __repr__(self):
+        return f"<HourlyRollup {self.bucket} - Bundle {self.bundle_id} - {self.status}>"
+
+class DailyRollup(RollupMixin, db.Model):
+    __tablename__ = "rollups_daily"
+    __table_args__ = (db.UniqueConstraint('bucket', 'bundle_id', 'router_id', 'status'),)
+
+    def __repr__(self):
+        return f"<DailyRollup {self.bucket} - Bundle {self.bundle_id} - {self.status}>"
+
+class MpesaCallback(db.Model):
+    __tablename__ = "mpesa_callbacks"
+
+    id = db.Column(db.Integer, primary_key=True)
+    checkout_request_id = db.Column(db.String(100), unique=True, nullable=True)  # one row per checkout; redeliveries collide
+    payload = db.Column(db.Text, nullable=False)  # raw JSON body as received from Safaricom
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True)  # pending, processing, processed, failed, orphaned
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<MpesaCallback {self.checkout_request_id} - {self.status}>"
+
 class Session(db.Model):
     __tablename__ = "sessions"
+    __table_args__ = (
+        db.Index('ix_sessions_user_id_id', 'user_id', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     bundle_id = db.Column(db.Integer, db.ForeignKey('bundles.id'), nullable=False)
-    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=True, index=True)
     session_token = db.Column(db.String(255), unique=True, nullable=False)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.now(), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
     expires_at = db.Column(db.DateTime, nullable=False)
 
     def __repr__(self):
@@ -130,7 +318,7 @@ class Admin(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     role = db.Column(db.String(50), default="SUPPORT")  # SUPERADMIN, MANAGER, SUPPORT
     password_hash = db.Column(db.String(255), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.now(), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
 
     # relationships
     audit_logs = db.relationship("AuditLog", backref="admin", lazy=True)
@@ -147,7 +335,7 @@ class SupportTicket(db.Model):
     subject = db.Column(db.String(255), nullable=False)
     message = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(50), default="OPEN")  # OPEN, IN_PROGRESS, RESOLVED, CLOSED
-    created_at = db.Column(db.DateTime, default=datetime.now(), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
 
     # relationship
     user = db.relationship("User", backref="tickets")
@@ -164,8 +352,18 @@ class AuditLog(db.Model):
     action = db.Column(db.String(255), nullable=False)   # e.g. "CREATE_BUNDLE"
     entity = db.Column(db.String(100), nullable=False)   # e.g. "Bundle"
     entity_id = db.Column(db.Integer, nullable=True)     # Which record was affected
-    timestamp = db.Column(db.DateTime, default=datetime.now(), nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.now, nullable=False)
 
     def __repr__(self):
         return f"<AuditLog {self.action} - {self.entity} ({self.entity_id})>"
 
+
+class JobLease(db.Model):
+    __tablename__ = "job_leases"
+
+    name = db.Column(db.String(50), primary_key=True)  # one row per leader-elected job group
+    holder = db.Column(db.String(100), nullable=False)  # host:pid of the current leader
+    expires_at = db.Column(db.DateTime, nullable=False)  # the lease is free to take after this
+
+    def __repr__(self):
+        return f"<JobLease {self.name} - {self.holder}>"
@@ -0,0 +1,99 @@
+import os
+import threading
+from functools import wraps
+from flask import request
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from metrics import metrics
+
+
+def _json_field(name):
+    data = request.get_json(silent=True)
+    value = data.get(name) if isinstance(data, dict) else None
+    return str(value).strip() if value else None
+
+def phone_key():
+    """The payer's phone in 2547XXXXXXXX form, so 07.., +2547.. and 2547.. share a limit."""
+    phone = _json_field('phone')
+    if not phone:
+        return f'ip:{get_remote_address()}'  # the request fails validation anyway
+    if phone.startswith('0'):
+        phone = '254' + phone[1:]
+    return f'phone:{phone.lstrip("+")}'
+
+def mac_key():
+    mac = _json_field('mac_address')
+    return f'mac:{mac.upper()}' if mac else f'ip:{get_remote_address()}'
+
+def _count_breach(request_limit):
+    metrics.incr('rate_limited')
+    metrics.incr(f'rate_limited_{request.endpoint}')
+
+
+# Limits are per process with memory://; point RATELIMIT_STORAGE_URI at Redis
+# (redis://host:6379) to share them between workers and hosts
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=os.environ.get('RATELIMIT_STORAGE_URI', 'memory://'),
+    strategy='moving-window',
+    headers_enabled=True,
+    swallow_errors=True,  # a storage outage lets requests through rather than failing them
+    on_breach=_count_breach,
+    enabled=os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true',
+)
+
+# Keyed on the payer and the device: every device on a hotspot reaches us from the
+# site's NAT address, so a per-IP limit would be shared by the whole site
+STK_PUSH_LIMITS = [
+    limiter.limit(os.environ.get('RATELIMIT_STKPUSH_PHONE', '3/minute;20/hour'), key_func=phone_key),
+    limiter.limit(os.environ.get('RATELIMIT_STKPUSH_MAC', '3/minute;20/hour'), key_func=mac_key),
+]
+if os.environ.get('RATELIMIT_STKPUSH_IP'):
+    # Optional flood ceiling per address, sized for a whole site
+    STK_PUSH_LIMITS.append(limiter.limit(os.environ['RATELIMIT_STKPUSH_IP']))
+
+LOGIN_LIMITS = [
+    limiter.limit(os.environ.get('RATELIMIT_LOGIN_IP', '10/minute;100/hour')),
+]
+
+SIGNUP_LIMITS = [
+    limiter.limit(os.environ.get('RATELIMIT_SIGNUP_IP', '5/minute;50/hour')),
+    limiter.limit(os.environ.get('RATELIMIT_SIGNUP_PHONE', '3/hour'), key_func=phone_key),
+]
+
+
+class LoadShedder:
+    """Per-process ceiling on requests in flight through an expensive endpoint.
+
+    A request that finds all `max_concurrent` slots taken gets a 503 at once
+    instead of queueing behind them for a Daraja call or a bcrypt hash.
+    """
+
+    def __init__(self, name, max_concurrent, retry_after=1):
+        self.name = name
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        metrics.gauge(f'{name}_in_flight', lambda: self._in_flight)
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self._slots.acquire(blocking=False):
+                metrics.incr('load_shed')
+                metrics.incr(f'load_shed_{self.name}')
+                return {'message': 'Server busy, please try again'}, 503, {'Retry-After': str(self.retry_after)}
+            with self._lock:
+                self._in_flight += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                self._slots.release()
+        return wrapper
+
+
+stk_push_shedder = LoadShedder('stkpush', int(os.environ.get('STKPUSH_MAX_CONCURRENCY', 20)))
+auth_shedder = LoadShedder('auth', int(os.environ.get('AUTH_MAX_CONCURRENCY', 16)))
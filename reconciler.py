@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from models import db, Transaction, MpesaCallback
+from metrics import metrics
+from resources.daraja import get_daraja_client, DarajaUnavailable, DarajaError
+
+
+QUERY_KEY_PREFIX = 'stk_query:'
+
+
+def query_key(checkout_request_id):
+    """Inbox key for an STK query answer; the real callback keeps the bare CheckoutRequestID."""
+    return QUERY_KEY_PREFIX + checkout_request_id
+
+
+class RateLimiter:
+    """Token bucket shared by the query threads: `rate` calls per second, bursts up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class PendingReconciler:
+    """Settles transactions whose callback never arrived by asking Daraja directly.
+
+    Pending transactions older than `min_age` seconds (and younger than
+    `max_age`, past which Daraja no longer knows the push) are queried with
+    the STK Push Query API on `concurrency` threads, at most `rate` queries
+    per second. A settled answer is stored as an MpesaCallback row in the
+    callback's own format, so it goes through the same queue, claim and
+    authorization path as a delivered callback. It is keyed by
+    query_key(), so a real callback that turns up later is still stored
+    and fills in the M-Pesa receipt the query answer does not carry.
+    """
+
+    def __init__(self, min_age=120, max_age=86400, batch_size=200, concurrency=4, rate=5.0):
+        self.min_age = timedelta(seconds=min_age)
+        self.max_age = timedelta(seconds=max_age)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate, burst=concurrency)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            min_age=int(os.environ.get('RECONCILE_MIN_AGE', 120)),
+            max_age=int(os.environ.get('RECONCILE_MAX_AGE', 86400)),
+            batch_size=int(os.environ.get('RECONCILE_BATCH_SIZE', 200)),
+            concurrency=int(os.environ.get('RECONCILE_CONCURRENCY', 4)),
+            rate=float(os.environ.get('RECONCILE_RATE', 5)),
+        )
+
+    def run(self, app):
+        """One reconciliation pass; returns how many transactions were settled."""
+        with app.app_context():
+            now = datetime.now()  # Transaction.created_at is local time
+            checkout_ids = [checkout_id for (checkout_id,) in db.session.query(Transaction.checkout_request_id).filter(
+                Transaction.status == 'pending',
+                Transaction.created_at < now - self.min_age,
+                Transaction.created_at > now - self.max_age,
+                Transaction.checkout_request_id.isnot(None),
+                ~db.exists().where(MpesaCallback.checkout_request_id.in_([
+                    Transaction.checkout_request_id, QUERY_KEY_PREFIX + Transaction.checkout_request_id
+                ]))
+            ).order_by(Transaction.created_at).limit(self.batch_size)]
+        if not checkout_ids:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            results = list(pool.map(self._query, checkout_ids))
+
+        settled = 0
+        with app.app_context():
+            for checkout_id, result in zip(checkout_ids, results):
+                if result is None:
+                    continue
+                stk_callback = {
+                    'MerchantRequestID': result.get('MerchantRequestID'),
+                    'CheckoutRequestID': checkout_id,
+                    'ResultCode': int(result.get('ResultCode')),
+                    'ResultDesc': result.get('ResultDesc'),
+                }
+                db.session.add(MpesaCallback(
+                    checkout_request_id=query_key(checkout_id),
+                    payload=json.dumps({'Body': {'stkCallback': stk_callback}, 'Source': 'stk_query'})
+                ))
+                try:
+                    db.session.commit()
+                except IntegrityError:
+                    # Another pass already stored this answer
+                    db.session.rollback()
+                    continue
+                settled += 1
+
+        # Picked up by the callback queue's resume scan in whichever process runs it
+        metrics.incr('reconciler_settled', settled)
+        print(f"Reconciler queried {len(checkout_ids)} pending transactions, settled {settled}.")
+        return settled
+
+    def _query(self, checkout_request_id):
+        self.limiter.acquire()
+        metrics.incr('reconciler_queries')
+        try:
+            result = get_daraja_client().stk_query(checkout_request_id)
+        except (DarajaUnavailable, DarajaError) as e:
+            print(f"STK query for {checkout_request_id} failed: {e}")
+            return None
+        if result is None or result.get('ResultCode') is None:
+            return None
+        return result
+
+
+pending_reconciler = PendingReconciler.from_env()
+
+
+def reconcile_pending_transactions(app):
+    pending_reconciler.run(app)
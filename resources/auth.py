@@ -2,11 +2,17 @@ from flask import request
 from flask_restful import Resource
 from flask_jwt_extended import create_access_token, create_refresh_token
 from models import db, User
+from hashing import HasherBusy
+from resources.serializers import LOGIN_USER
+from rate_limits import LOGIN_LIMITS, SIGNUP_LIMITS, auth_shedder
 import bleach
 from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime, timezone
 
 class SignUpResource(Resource):
+    decorators = SIGNUP_LIMITS
+
+    @auth_shedder
     def post(self):
         data = request.get_json()
 
@@ -34,6 +40,8 @@ class SignUpResource(Resource):
                 created_at=datetime.now(timezone.utc),
             )
             new_user.password = data["password"]  # This triggers the setter to hash
+        except HasherBusy:
+            return {"message": "Server busy, please try again"}, 503, {"Retry-After": "2"}
         except SQLAlchemyError as e:
             db.session.rollback()
             return {"message": "Error creating user", "error": str(e)}, 500
@@ -44,6 +52,9 @@ class SignUpResource(Resource):
         return {"message": "User created successfully"}, 201
     
 class LoginResource(Resource):
+    decorators = LOGIN_LIMITS
+
+    @auth_shedder
     def post(self):
         data = request.get_json()
         email = data.get("email")
@@ -53,8 +64,20 @@ class LoginResource(Resource):
             return {"message": "Email and password are required"}, 400
 
         user = User.query.filter_by(email=email).first()
-        if not user or not user.verify_password(password):
-            return {"message": "Invalid credentials"}, 401
+        try:
+            if not user or not user.verify_password(password):
+                return {"message": "Invalid credentials"}, 401
+        except HasherBusy:
+            return {"message": "Server busy, please try again"}, 503, {"Retry-After": "2"}
+
+        # Upgrade hashes made with an older BCRYPT_LOG_ROUNDS while we have the password
+        if user.password_needs_rehash():
+            try:
+                user.password = password
+                db.session.commit()
+            except HasherBusy:
+                # Already authenticated; the hash is upgraded on a later login
+                pass
 
         access_token = create_access_token(identity=user.id)
         refresh_token = create_refresh_token(identity=user.id)
@@ -62,10 +85,5 @@ class LoginResource(Resource):
         return {
             "access_token": access_token,
             "refresh_token": refresh_token,
-            "user": {
-                "id": user.id,
-                "username": user.username,
-                "email": user.email,
-                "phone": user.phone
-            }
+            "user": LOGIN_USER.dump_object(user)
         }, 200
\ No newline at end of file
@@ -1,47 +1,108 @@
-from flask import request
+from flask import request, Response
 from flask_restful import Resource
 from flask_jwt_extended import jwt_required
 from models import db
 from models import Bundle
+from resources.serializers import BUNDLE, dumps
 from sqlalchemy.exc import SQLAlchemyError
 import bleach
+import gzip
+import hashlib
+import os
+import threading
+import time
 from datetime import datetime
 
+class BundleCatalogue:
+    """The bundle list, serialized and gzipped once and served from memory.
+
+    Writes in this process drop the cached blob. One thread rebuilds it
+    under the lock; invalidate() takes the same lock, so a write during a
+    rebuild clears what that rebuild cached once it is done. Other gunicorn
+    workers pick the change up once their copy is `ttl` seconds old. The ETag is a hash of the body, so it matches across workers; the
+    gzipped body is a different representation and gets its own tag.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entry = None  # {'etag', 'body', 'gzip_etag', 'gzipped', 'built_at'}
+
+    def get(self):
+        entry = self._entry
+        if entry and time.monotonic() - entry['built_at'] < self.ttl:
+            return entry
+
+        with self._lock:
+            entry = self._entry
+            if entry and time.monotonic() - entry['built_at'] < self.ttl:
+                return entry
+            body = dumps(BUNDLE.dump_many(BUNDLE.query().order_by(Bundle.id)))
+            etag = hashlib.sha1(body).hexdigest()
+            entry = {
+                'etag': etag,
+                'body': body,
+                'gzip_etag': f'{etag}-gz',
+                'gzipped': gzip.compress(body, mtime=0),  # same bytes in every worker
+                'built_at': time.monotonic(),
+            }
+            self._entry = entry
+            return entry
+
+    def invalidate(self):
+        with self._lock:
+            self._entry = None
+
+bundle_catalogue = BundleCatalogue(ttl=int(os.environ.get('BUNDLE_CACHE_TTL', 60)))
+
 class BundleResource(Resource):
     def get(self):
-        bundles = Bundle.query.all()
-
-        return [{
-            "id": bundle.id,
-            "name": bundle.name,
-            "description": bundle.description,
-            "price": bundle.price,
-            "created_at": bundle.created_at.isoformat()
-        } for bundle in bundles], 200
+        catalogue = bundle_catalogue.get()
+        gzipped = 'gzip' in request.accept_encodings
+        etag = catalogue['gzip_etag'] if gzipped else catalogue['etag']
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        elif gzipped:
+            response = Response(catalogue['gzipped'], mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(catalogue['body'], mimetype='application/json')
+
+        response.set_etag(etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     
     @jwt_required()
     def post(self):
         data = request.get_json()
 
-        required_fields = ['name', 'description', 'price']
+        required_fields = ['name', 'data_amount', 'duration', 'price']
         for field in required_fields:
             if field not in data:
                 return {'message': f'{field} is required'}, 400
         
         try:
+            # The validators parse duration_seconds and data_cap_bytes from these
             new_bundle = Bundle (
                 name = bleach.clean(data['name']),
-                description = bleach.clean(data['description']),
+                data_amount = bleach.clean(data['data_amount']),
+                duration = bleach.clean(data['duration']),
                 price = data['price'],
                 created_at = datetime.now()
             )
+        except ValueError as e:
+            return {'message': str(e)}, 400
+
+        try:
+            db.session.add(new_bundle)
+            db.session.commit()
         except SQLAlchemyError as e:
             db.session.rollback()
             return {'message': 'Error creating bundle', 'error': str(e)}, 500
 
-        db.session.flush()
-        db.session.add(new_bundle)
-        db.session.commit()
+        bundle_catalogue.invalidate()
         return {"message": "Bundle created successfully"}, 201
     
     @jwt_required()
@@ -51,10 +112,16 @@ class BundleResource(Resource):
         if not bundle:
             return {"message": "Bundle not found"}, 404
 
-        if 'name' in data:
-            bundle.name = bleach.clean(data['name'])
-        if 'description' in data:
-            bundle.description = bleach.clean(data['description'])
+        try:
+            if 'name' in data:
+                bundle.name = bleach.clean(data['name'])
+            if 'data_amount' in data:
+                bundle.data_amount = bleach.clean(data['data_amount'])
+            if 'duration' in data:
+                bundle.duration = bleach.clean(data['duration'])
+        except ValueError as e:
+            db.session.rollback()
+            return {'message': str(e)}, 400
         if 'price' in data:
             bundle.price = data['price']
         
@@ -64,6 +131,7 @@ class BundleResource(Resource):
             db.session.rollback()
             return {'message': 'Error updating bundle', 'error': str(e)}, 500
 
+        bundle_catalogue.invalidate()
         return {"message": "Bundle updated successfully"}, 200
     
     @jwt_required()
@@ -80,4 +148,5 @@ class BundleResource(Resource):
             db.session.rollback()
             return {'message': 'Error deleting bundle', 'error': str(e)}, 500
 
+        bundle_catalogue.invalidate()
         return {"message": "Bundle deleted successfully"}, 200     
@@ -0,0 +1,284 @@
+import base64
+import os
+import random
+import threading
+import time
+import requests
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from metrics import metrics
+
+
+class DarajaUnavailable(Exception):
+    """Raised while Daraja is failing and calls are being short-circuited."""
+
+    def __init__(self, message, retry_after=30):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DarajaError(Exception):
+    """Raised when Daraja answered, but not with a usable response."""
+
+    def __init__(self, message, status_code=None, body=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+class CircuitBreaker:
+    """Stops calling a dependency after repeated failures, then probes it again.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls fail at once for `reset_timeout` seconds. Then a single trial call
+    is let through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._trial_running:
+                metrics.incr('daraja_short_circuited')
+                raise DarajaUnavailable("M-Pesa is temporarily unavailable", retry_after=max(1, int(remaining) + 1))
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    print(f"Daraja circuit opened after {self._failures} failures")
+                    metrics.incr('daraja_circuit_opened')
+                self._opened_at = time.monotonic()
+
+
+class AccessTokenCache:
+    """Daraja OAuth token shared by every thread in the process.
+
+    A token is reused until `refresh_margin` seconds before its `expires_in`
+    runs out. Only one caller refreshes at a time; the others wait on the
+    lock and pick up the token it fetched.
+    """
+
+    def __init__(self, refresh_margin=60):
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._entry = (None, 0.0)  # (token, refresh_at)
+
+    def get(self, fetch):
+        token, refresh_at = self._entry
+        if token and time.monotonic() < refresh_at:
+            return token
+
+        with self._lock:
+            token, refresh_at = self._entry
+            if token and time.monotonic() < refresh_at:
+                return token
+
+            token, expires_in = fetch()
+            self._entry = (token, time.monotonic() + max(0, expires_in - self.refresh_margin))
+            return token
+
+    def invalidate(self, token):
+        """Drops `token` if it is still the cached one."""
+        with self._lock:
+            if self._entry[0] == token:
+                self._entry = (None, 0.0)
+
+
+class DarajaClient:
+    """Safaricom Daraja API client on one pooled keep-alive session.
+
+    Timeouts are split so a dead host fails in `connect_timeout` seconds
+    rather than the full read budget. Idempotent calls (OAuth, queries) are
+    retried with jittered exponential backoff on connection errors, timeouts
+    and 5xx answers. An STK push is only retried when the connection was
+    never made, since a retried push could prompt the customer twice.
+    Failures that survive the retries feed a circuit breaker.
+    """
+
+    def __init__(self, base_url, consumer_key, consumer_secret, connect_timeout=3.05, read_timeout=15.0,
+                 retries=2, backoff_base=0.25, backoff_max=2.0, pool_size=20,
+                 failure_threshold=5, reset_timeout=30.0):
+        self.base_url = base_url.rstrip('/')
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.tokens = AccessTokenCache()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        metrics.gauge('daraja_circuit_open', lambda: int(self.breaker.state != 'closed'))
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            base_url=os.environ.get('MPESA_BASE_URL', 'https://sandbox.safaricom.co.ke'),
+            consumer_key=os.environ.get('MPESA_CONSUMER_KEY'),
+            consumer_secret=os.environ.get('MPESA_CONSUMER_SECRET'),
+            connect_timeout=float(os.environ.get('DARAJA_CONNECT_TIMEOUT', 3.05)),
+            read_timeout=float(os.environ.get('DARAJA_READ_TIMEOUT', 15)),
+            retries=int(os.environ.get('DARAJA_RETRIES', 2)),
+            pool_size=int(os.environ.get('DARAJA_POOL_SIZE', 20)),
+            failure_threshold=int(os.environ.get('DARAJA_BREAKER_THRESHOLD', 5)),
+            reset_timeout=float(os.environ.get('DARAJA_BREAKER_RESET', 30)),
+        )
+
+    def _backoff(self, attempt):
+        # Full jitter keeps workers that failed together from retrying together
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, method, path, idempotent=False, is_failure=None, **kwargs):
+        """Sends one call through the breaker and the retry policy; returns the final response.
+
+        4xx answers are returned to the caller; they say nothing about
+        Daraja's health. `is_failure(response)` overrides which answers count
+        as failures (by default any 5xx).
+        """
+        is_failure = is_failure or (lambda response: response.status_code >= 500)
+        self.breaker.before_call()
+        kwargs.setdefault('timeout', self.timeout)
+        url = f'{self.base_url}{path}'
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+                error = f"HTTP {response.status_code}" if is_failure(response) else None
+            except requests.ConnectTimeout as e:
+                response, error, retryable = None, e, True
+            except requests.RequestException as e:
+                response, error, retryable = None, e, idempotent
+            else:
+                retryable = idempotent
+            metrics.observe('daraja_request_seconds', time.perf_counter() - started)
+
+            if error is None:
+                self.breaker.record_success()
+                return response
+            if not retryable or attempt >= self.retries:
+                self.breaker.record_failure()
+                if response is not None:
+                    raise DarajaError(f"Daraja returned {error}", response.status_code, response.text)
+                raise DarajaUnavailable(f"Daraja request failed: {error}")
+            metrics.incr('daraja_retries')
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def fetch_access_token(self):
+        response = self.request('GET', '/oauth/v1/generate', idempotent=True,
+                                params={'grant_type': 'client_credentials'},
+                                auth=(self.consumer_key, self.consumer_secret))
+        if response.status_code != 200:
+            raise DarajaError("Failed to get access token", response.status_code, response.text)
+        data = response.json()
+        return data['access_token'], int(data.get('expires_in', 3599))
+
+    def access_token(self):
+        return self.tokens.get(self.fetch_access_token)
+
+    def post_authorized(self, path, payload, idempotent=False, is_failure=None):
+        """POSTs with the cached bearer token, refreshing it once if Daraja rejects it."""
+        token = self.access_token()
+        response = self.request('POST', path, idempotent=idempotent, is_failure=is_failure, json=payload,
+                                headers={'Authorization': f'Bearer {token}'})
+        if response.status_code == 401:
+            # Token revoked or expired early; refresh once and retry
+            self.tokens.invalidate(token)
+            token = self.access_token()
+            response = self.request('POST', path, idempotent=idempotent, is_failure=is_failure, json=payload,
+                                    headers={'Authorization': f'Bearer {token}'})
+        return response
+
+    def stk_push(self, payload):
+        response = self.post_authorized('/mpesa/stkpush/v1/processrequest', payload)
+        if response.status_code != 200:
+            raise DarajaError(f"Daraja returned HTTP {response.status_code}", response.status_code, response.text)
+        return response.json()
+
+    def stk_query(self, checkout_request_id):
+        """Asks Daraja for the outcome of an STK push.
+
+        Returns the query response, whose ResultCode has the same meaning as
+        in the callback, or None while the customer has not answered yet.
+        """
+        response = self.post_authorized('/mpesa/stkpushquery/v1/query', dict(
+            stk_credentials(), CheckoutRequestID=checkout_request_id
+        ), idempotent=True, is_failure=lambda r: r.status_code >= 500 and not still_processing(r))
+        if still_processing(response):
+            return None
+        if response.status_code != 200:
+            raise DarajaError(f"Daraja returned HTTP {response.status_code}", response.status_code, response.text)
+        return response.json()
+
+
+def stk_credentials():
+    """BusinessShortCode, Password and Timestamp fields for STK push and query requests."""
+    shortcode = os.environ.get('MPESA_SHORTCODE')
+    passkey = os.environ.get('MPESA_PASSKEY')
+    timestamp = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+    password = base64.b64encode((shortcode + passkey + timestamp).encode()).decode()
+    return {'BusinessShortCode': shortcode, 'Password': password, 'Timestamp': timestamp}
+
+
+def still_processing(response):
+    # Daraja answers a query for an unanswered push with a 500 and this code
+    if response.status_code != 500:
+        return False
+    try:
+        return response.json().get('errorCode') == '500.001.1001'
+    except ValueError:
+        return False
+
+
+_daraja_client = None
+_daraja_client_lock = threading.Lock()
+
+
+def get_daraja_client():
+    """Returns the process-wide Daraja client, creating it from the environment on first use."""
+    global _daraja_client
+    if _daraja_client is None:
+        with _daraja_client_lock:
+            if _daraja_client is None:
+                _daraja_client = DarajaClient.from_env()
+    return _daraja_client
+
+
+def set_daraja_client(client):
+    """Replaces the process-wide client, e.g. with one pointed at a local stub."""
+    global _daraja_client
+    with _daraja_client_lock:
+        _daraja_client = client
@@ -0,0 +1,8 @@
+from flask_restful import Resource
+from flask_jwt_extended import jwt_required
+from metrics import metrics
+
+class MetricsResource(Resource):
+    @jwt_required()
+    def get(self):
+        return metrics.snapshot(), 200
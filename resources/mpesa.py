@@ -1,22 +1,45 @@
 from flask_restful import Resource
 from flask import request
-import requests
-import base64
+import json
 import os
-from datetime import datetime, timezone, timedelta
-from models import db, Transaction, Bundle
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from models import db, Transaction, Bundle, MpesaCallback, Router, parse_duration
+from callback_queue import callback_queue
+from rollups import record_settlement
+from metrics import metrics
+from rate_limits import STK_PUSH_LIMITS, stk_push_shedder
+from resources.daraja import get_daraja_client, stk_credentials, DarajaUnavailable, DarajaError
+from sqlalchemy.exc import IntegrityError
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
+class RecentCheckouts:
+    """Bounded LRU of CheckoutRequestIDs this process has already accepted."""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._ids = OrderedDict()
+
+    def seen(self, checkout_request_id):
+        with self._lock:
+            if checkout_request_id in self._ids:
+                self._ids.move_to_end(checkout_request_id)
+                return True
+            return False
+
+    def add(self, checkout_request_id):
+        with self._lock:
+            self._ids[checkout_request_id] = None
+            self._ids.move_to_end(checkout_request_id)
+            if len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+recent_checkouts = RecentCheckouts(max_size=int(os.environ.get('CALLBACK_DEDUP_CACHE_SIZE', 10000)))
+
 class MpesaResource(Resource):
-    def get_access_token(self):
-        consumer_key = os.environ.get('MPESA_CONSUMER_KEY')
-        consumer_secret = os.environ.get('MPESA_CONSUMER_SECRET')
-        api_url = 'https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials'
-        response = requests.get(api_url, auth=(consumer_key, consumer_secret))
-        if response.status_code == 200:
-            return response.json()['access_token']
-        else:
-            return None
+    decorators = STK_PUSH_LIMITS
 
     def normalize_phone(self, phone: str) -> str:
         """Ensure phone number is in 2547XXXXXXXX format"""
@@ -27,6 +50,7 @@ class MpesaResource(Resource):
         return phone
 
     @jwt_required()
+    @stk_push_shedder
     def post(self):
         # Initiate STK Push
         data = request.get_json()
@@ -49,116 +73,168 @@ class MpesaResource(Resource):
         if not bundle:
             return {'message': 'Bundle not found'}, 404
 
+        # Site the device is on; the portal passes the hotspot's name when there are several
+        router_id = None
+        if data.get('site'):
+            router = Router.query.filter_by(name=data['site'], is_active=True).first()
+            if not router:
+                return {'message': 'Site not found'}, 404
+            router_id = router.id
+
         user_id = get_jwt_identity()
+        bundle_id = bundle.id
+        account_reference = plan
+
+        # Prepare STK Push data
+        credentials = stk_credentials()
+        stk_data = dict(
+            credentials,
+            TransactionType="CustomerPayBillOnline",
+            Amount=amount,
+            PartyA=phone,
+            PartyB=credentials['BusinessShortCode'],
+            PhoneNumber=phone,
+            CallBackURL=f"{os.environ.get('BASE_URL')}/mpesa/callback",
+            AccountReference=account_reference,
+            TransactionDesc=transaction_desc
+        )
+
+        # Hand the DB connection back while we wait on Safaricom
+        db.session.rollback()
+        try:
+            resp_data = get_daraja_client().stk_push(stk_data)
+        except DarajaUnavailable as e:
+            return {'message': 'M-Pesa is temporarily unavailable, please try again shortly'}, 503, \
+                {'Retry-After': str(e.retry_after)}
+        except DarajaError as e:
+            return {'message': 'STK Push request failed', 'error': str(e)}, 500
 
         # Create transaction
         transaction = Transaction(
             user_id=user_id,
-            bundle_id=bundle.id,
+            bundle_id=bundle_id,
             amount=amount,
             status='pending',
             mac_address=mac_address,
-            ip_address=ip_address
+            ip_address=ip_address,
+            router_id=router_id,
+            checkout_request_id=resp_data.get('CheckoutRequestID')
         )
         db.session.add(transaction)
-        db.session.flush()
-        account_reference = plan
-
-        # Get access token
-        access_token = self.get_access_token()
-        if not access_token:
-            return {'message': 'Failed to get access token'}, 500
-
-        # Prepare STK Push data
-        shortcode = os.environ.get('MPESA_SHORTCODE')
-        passkey = os.environ.get('MPESA_PASSKEY')
-        timestamp = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
-        password = base64.b64encode((shortcode + passkey + timestamp).encode()).decode()
-
-        stk_data = {
-            "BusinessShortCode": shortcode,
-            "Password": password,
-            "Timestamp": timestamp,
-            "TransactionType": "CustomerPayBillOnline",
-            "Amount": amount,
-            "PartyA": phone,
-            "PartyB": shortcode,
-            "PhoneNumber": phone,
-            "CallBackURL": f"{os.environ.get('BASE_URL')}/mpesa/callback",
-            "AccountReference": account_reference,
-            "TransactionDesc": transaction_desc
-        }
-
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-
-        stk_url = 'https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest'
-
-        try:
-            response = requests.post(stk_url, json=stk_data, headers=headers, timeout=30)
-            response.raise_for_status()
-        except requests.RequestException as e:
-            return {'message': 'STK Push request failed', 'error': str(e)}, 500
-
-        resp_data = response.json()
-        # Update transaction with checkout_request_id
-        transaction.checkout_request_id = resp_data.get('CheckoutRequestID')
         db.session.commit()
         return resp_data, 200
 
-class MpesaCallbackResource(Resource):
-    def post(self):
-        # Handle callback
-        data = request.get_json()
-
-        # Parse the callback data
-        body = data.get('Body', {})
-        stk_callback = body.get('stkCallback', {})
-        checkout_request_id = stk_callback.get('CheckoutRequestID')
-        result_code = stk_callback.get('ResultCode')
-
-        # Find transaction by checkout_request_id
-        transaction = Transaction.query.filter_by(checkout_request_id=checkout_request_id).first()
-        if not transaction:
-            return {'message': 'Transaction not found'}, 404
-
-        if result_code == 0:
-            # Success
-            callback_metadata = stk_callback.get('CallbackMetadata', {}).get('Item', [])
-            mpesa_receipt_number = None
-            transaction_date = None
-            for item in callback_metadata:
-                if item['Name'] == 'MpesaReceiptNumber':
-                    mpesa_receipt_number = item['Value']
-                elif item['Name'] == 'TransactionDate':
-                    transaction_date = item['Value']
-
+class UnknownCheckout(Exception):
+    """Raised when a callback names a CheckoutRequestID that no transaction has."""
+
+
+def callback_receipt(stk_callback):
+    """Returns the (MpesaReceiptNumber, TransactionDate) of a successful stkCallback."""
+    mpesa_receipt_number = None
+    transaction_date = None
+    for item in stk_callback.get('CallbackMetadata', {}).get('Item', []):
+        if item['Name'] == 'MpesaReceiptNumber':
+            mpesa_receipt_number = item['Value']
+        elif item['Name'] == 'TransactionDate':
+            transaction_date = item['Value']
+    return mpesa_receipt_number, transaction_date
+
+
+def apply_stk_callback(stk_callback, last_attempt=True):
+    """Applies a Daraja stkCallback to its transaction and authorizes the device on success.
+
+    The caller commits. Returns False when another attempt should be made
+    because the router authorization failed; on the last attempt the
+    transaction is marked 'failed_authorization' instead. Raises
+    UnknownCheckout when there is no transaction for the callback, which
+    is retried too, since the STK push that creates it may still be
+    committing.
+    """
+    checkout_request_id = stk_callback.get('CheckoutRequestID')
+    result_code = stk_callback.get('ResultCode')
+
+    # Find transaction by checkout_request_id
+    transaction = Transaction.query.filter_by(checkout_request_id=checkout_request_id).first()
+    if not transaction:
+        raise UnknownCheckout(f"No transaction for CheckoutRequestID {checkout_request_id}")
+    mpesa_receipt_number, transaction_date = callback_receipt(stk_callback)
+    if transaction.status != 'pending':
+        if result_code == 0 and mpesa_receipt_number and transaction.mpesa_code is None \
+                and not Transaction.query.filter_by(mpesa_code=mpesa_receipt_number).first():
+            # Settled earlier from an STK query, which carries no receipt; the real callback does
             transaction.mpesa_code = mpesa_receipt_number
-            transaction.status = 'completed'
             transaction.transaction_date = transaction_date
+            metrics.incr('callback_late_receipts')
+            return True
+        # Redelivery of a callback that was already applied
+        metrics.incr('callback_duplicates')
+        return True
+
+    if result_code == 0:
+        # Success
+        if mpesa_receipt_number and Transaction.query.filter_by(mpesa_code=mpesa_receipt_number).first():
+            print(f"Receipt {mpesa_receipt_number} already applied to another transaction")
+            metrics.incr('callback_duplicates')
+            return True
+
+        transaction.mpesa_code = mpesa_receipt_number
+        transaction.status = 'completed'
+        transaction.transaction_date = transaction_date
+
+        # Calculate expiry time based on bundle
+        bundle = db.session.query(Bundle.name, Bundle.duration_seconds, Bundle.duration).filter(
+            Bundle.id == transaction.bundle_id
+        ).one()
+        # Left NULL by the migration when the strings did not parse; this raises with the bad value
+        duration_seconds = bundle.duration_seconds or parse_duration(bundle.duration)
+        transaction.expires_at = datetime.utcnow() + timedelta(seconds=duration_seconds)
+
+        # AUTHORIZE ON ROUTER
+        from resources.router import RouterManager
+        router = RouterManager(transaction.router_id)
+        comment = f"user:{transaction.user_id}|bundle:{bundle.name}|tx:{transaction.id}"
+        success = router.authorize_mac(transaction.mac_address, transaction.ip_address, comment)
+
+        if not success:
+            if not last_attempt:
+                db.session.rollback()
+                return False
+            transaction.status = 'failed_authorization'
+        else:
+            from scheduler import expiry_scheduler
+            expiry_scheduler.schedule(transaction.id, transaction.expires_at, transaction.router_id)
 
-            # Calculate expiry time based on bundle
-            bundle = Bundle.query.get(transaction.bundle_id)
-            # Assuming bundle.duration is in hours
-            duration_hours = int(bundle.duration.split()[0]) if bundle.duration else 24
-            transaction.expires_at = datetime.utcnow() + timedelta(hours=duration_hours)
-
-            # AUTHORIZE ON ROUTER
-            from resources.router import RouterManager
-            router = RouterManager()
-            comment = f"user:{transaction.user_id}|bundle:{bundle.name}|tx:{transaction.id}"
-            success = router.authorize_mac(transaction.mac_address, transaction.ip_address, comment)
-            router.disconnect()
+    else:
+        # Failed
+        transaction.status = 'failed'
 
-            if not success:
-                transaction.status = 'failed_authorization'
+    record_settlement(transaction)
+    return True
 
-        else:
-            # Failed
-            transaction.status = 'failed'
+class MpesaCallbackResource(Resource):
+    def post(self):
+        # Persist the raw payload and acknowledge; the callback queue does the rest
+        data = request.get_json(silent=True) or {}
+        stk_callback = data.get('Body', {}).get('stkCallback', {})
+        checkout_request_id = stk_callback.get('CheckoutRequestID')
 
-        db.session.commit()
-        return {'message': 'Callback processed'}, 200
+        # Safaricom redelivers; answer repeats without touching the DB or router
+        if checkout_request_id and recent_checkouts.seen(checkout_request_id):
+            metrics.incr('callback_duplicates')
+            return {'message': 'Callback received'}, 200
 
+        callback = MpesaCallback(checkout_request_id=checkout_request_id, payload=json.dumps(data))
+        db.session.add(callback)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Already stored by an earlier delivery, possibly in another worker
+            db.session.rollback()
+            recent_checkouts.add(checkout_request_id)
+            metrics.incr('callback_duplicates')
+            return {'message': 'Callback received'}, 200
+
+        if checkout_request_id:
+            recent_checkouts.add(checkout_request_id)
+        callback_queue.submit(callback.id)
+        return {'message': 'Callback received'}, 200
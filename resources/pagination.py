@@ -0,0 +1,62 @@
+from flask import request
+from datetime import datetime
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+def int_arg(name):
+    """An integer query string argument, or None when it is absent.
+
+    Raises ValueError with a client-facing message when it is present but
+    not an integer, so a mistyped filter is rejected rather than ignored.
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+def date_range():
+    """The (from, to) query string dates, either of them None when absent.
+
+    Raises ValueError with a client-facing message on bad input.
+    """
+    try:
+        date_from = datetime.fromisoformat(request.args['from']) if 'from' in request.args else None
+        date_to = datetime.fromisoformat(request.args['to']) if 'to' in request.args else None
+    except ValueError:
+        raise ValueError("from and to must be ISO 8601 dates")
+    return date_from, date_to
+
+def page_args():
+    """Reads limit, cursor and the from/to date range from the query string.
+
+    Raises ValueError with a client-facing message on bad input.
+    """
+    limit = int_arg('limit')
+    limit = DEFAULT_LIMIT if limit is None else limit
+    cursor = int_arg('cursor')
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    date_from, date_to = date_range()
+
+    return {
+        'limit': min(limit, MAX_LIMIT),
+        'cursor': cursor,
+        'date_from': date_from,
+        'date_to': date_to,
+    }
+
+def keyset_page(query, id_column, limit, cursor=None):
+    """Returns one page of rows, newest id first, and the cursor for the next page.
+
+    The cursor is the last id served, so each page is an index range scan on
+    the primary key however deep the client pages.
+    """
+    if cursor is not None:
+        query = query.filter(id_column < cursor)
+    rows = query.order_by(id_column.desc()).limit(limit + 1).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
@@ -0,0 +1,63 @@
+from flask import request
+from flask_restful import Resource
+from flask_jwt_extended import jwt_required
+from models import HourlyRollup, DailyRollup
+from resources.pagination import int_arg
+from resources.serializers import HOURLY_ROLLUP, DAILY_ROLLUP
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+ROLLUPS = {
+    'hourly': (HourlyRollup, HOURLY_ROLLUP, timedelta(hours=48)),
+    'daily': (DailyRollup, DAILY_ROLLUP, timedelta(days=31)),
+}
+
+class ReportsResource(Resource):
+    @jwt_required()
+    def get(self):
+        """Revenue and data use per bucket, bundle, site and status, read from the rollup tables.
+
+        `granularity` is hourly or daily (default). `from`/`to` are UTC and
+        default to the last 48 hours or 31 days; `bundle_id`, `router_id`
+        (0 for the default router) and `status` narrow the rows.
+        """
+        granularity = request.args.get('granularity', 'daily')
+        if granularity not in ROLLUPS:
+            return {'message': 'granularity must be hourly or daily'}, 400
+        model, schema, default_window = ROLLUPS[granularity]
+
+        try:
+            date_to = datetime.fromisoformat(request.args['to']) if 'to' in request.args else datetime.utcnow()
+            date_from = datetime.fromisoformat(request.args['from']) if 'from' in request.args \
+                else date_to - default_window
+        except ValueError:
+            return {'message': 'from and to must be ISO 8601 dates'}, 400
+        try:
+            bundle_id = int_arg('bundle_id')
+            router_id = int_arg('router_id')
+        except ValueError as e:
+            return {'message': str(e)}, 400
+
+        query = schema.query().filter(model.bucket >= date_from, model.bucket < date_to)
+        if bundle_id is not None:
+            query = query.filter(model.bundle_id == bundle_id)
+        if router_id is not None:
+            query = query.filter(model.router_id == router_id)
+        if request.args.get('status'):
+            query = query.filter(model.status == request.args['status'])
+        rows = query.order_by(model.bucket, model.bundle_id, model.router_id, model.status).all()
+
+        totals = {'transactions': 0, 'revenue': Decimal(0), 'bytes_used': 0}
+        for row in rows:
+            totals['transactions'] += row.transactions
+            totals['bytes_used'] += row.bytes_used
+            if row.status == 'completed':
+                totals['revenue'] += row.revenue
+
+        return {
+            'granularity': granularity,
+            'from': date_from,
+            'to': date_to,
+            'rows': schema.dump_many(rows),
+            'totals': totals,
+        }, 200
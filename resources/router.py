@@ -1,47 +1,211 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
 from routeros_api import RouterOsApiPool
-from datetime import timedelta
+from routeros_api.exceptions import (
+    RouterOsApiConnectionError, FatalRouterOsApiError, RouterOsApiCommunicationError
+)
+from models import db, Router
 
-class RouterManager:
-    def __init__(self):
-        self.host = os.environ.get('MIKROTIK_HOST')
-        self.username = os.environ.get('MIKROTIK_USERNAME')
-        self.password = os.environ.get('MIKROTIK_PASSWORD')
-        self.api_pool = None
-
-    def connect(self):
-        """Initializes the connection pool."""
+
+class RouterUnavailable(Exception):
+    """Raised when no RouterOS session can be handed out."""
+
+
+class RouterConnectionPool:
+    """Long-lived, thread-safe pool of logged-in RouterOS API sessions for one router.
+
+    Each RouterOsApiPool wraps a single socket, so the pool keeps a list of
+    idle ones and caps how many can be checked out at the same time.
+    """
+
+    def __init__(self, host, username, password, port=8728, max_sessions=4,
+                 acquire_timeout=10.0, health_check_interval=30.0,
+                 backoff_base=0.5, backoff_max=30.0):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.port = port
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._slots = threading.BoundedSemaphore(max_sessions)
+        self._lock = threading.Lock()
+        self._idle = []  # [(RouterOsApiPool, api, last_used)]
+        self._failures = 0
+        self._retry_at = 0.0
+        self._closed = False
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            host=os.environ.get('MIKROTIK_HOST'),
+            username=os.environ.get('MIKROTIK_USERNAME'),
+            password=os.environ.get('MIKROTIK_PASSWORD'),
+            port=int(os.environ.get('MIKROTIK_API_PORT', 8728)),
+            max_sessions=int(os.environ.get('MIKROTIK_MAX_SESSIONS', 4)),
+            acquire_timeout=float(os.environ.get('MIKROTIK_ACQUIRE_TIMEOUT', 10)),
+            health_check_interval=float(os.environ.get('MIKROTIK_HEALTH_CHECK_INTERVAL', 30)),
+        )
+
+    @classmethod
+    def from_router(cls, router):
+        """Pool for a registered site; unset credentials and limits fall back to MIKROTIK_*."""
+        return cls(
+            host=router.host,
+            username=router.username,
+            password=router.password if router.password is not None else os.environ.get('MIKROTIK_PASSWORD'),
+            port=router.api_port,
+            max_sessions=router.max_sessions or int(os.environ.get('MIKROTIK_MAX_SESSIONS', 4)),
+            acquire_timeout=float(os.environ.get('MIKROTIK_ACQUIRE_TIMEOUT', 10)),
+            health_check_interval=float(os.environ.get('MIKROTIK_HEALTH_CHECK_INTERVAL', 30)),
+        )
+
+    def _open(self):
+        """Opens and logs in a new session, backing off after repeated failures."""
+        with self._lock:
+            wait = self._retry_at - time.monotonic()
+        if wait > 0:
+            raise RouterUnavailable(f"Router {self.host} unreachable, retrying in {wait:.1f}s")
+
+        conn = RouterOsApiPool(
+            host=self.host,
+            username=self.username,
+            password=self.password,
+            port=self.port,
+            use_ssl=False
+        )
         try:
-            self.api_pool = RouterOsApiPool(
-                host=self.host,
-                username=self.username,
-                password=self.password,
-                port=int(os.environ.get('MIKROTIK_API_PORT', 8728)),
-                use_ssl=False
-            )
+            api = conn.get_api()
+        except Exception:
+            conn.disconnect()
+            with self._lock:
+                self._failures += 1
+                backoff = min(self.backoff_max, self.backoff_base * 2 ** (self._failures - 1))
+                self._retry_at = time.monotonic() + backoff
+            raise
+
+        with self._lock:
+            self._failures = 0
+            self._retry_at = 0.0
+        return conn, api
+
+    def _is_healthy(self, api):
+        try:
+            api.get_resource('/system/identity').get()
             return True
-        except Exception as e:
-            print(f"Router connection failed: {e}")
+        except Exception:
             return False
 
-    def get_api(self):
-        """Gets an API object from the pool."""
-        if not self.api_pool:
-            self.connect()
-        return self.api_pool.get_api()
+    def _checkout(self):
+        while True:
+            with self._lock:
+                entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                return self._open()
+
+            conn, api, last_used = entry
+            if time.monotonic() - last_used < self.health_check_interval or self._is_healthy(api):
+                return conn, api
+            print(f"Dropping stale router session to {self.host}")
+            conn.disconnect()
+
+    def _checkin(self, conn, api):
+        with self._lock:
+            if not self._closed and conn.connected:
+                self._idle.append((conn, api, time.monotonic()))
+                return
+        conn.disconnect()
+
+    @contextmanager
+    def api(self):
+        """Borrows a logged-in API object for the duration of the block."""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise RouterUnavailable(f"All sessions to {self.host} are busy")
+        try:
+            conn, api = self._checkout()
+            try:
+                yield api
+            except (RouterOsApiConnectionError, FatalRouterOsApiError):
+                conn.disconnect()
+                raise
+            except BaseException:
+                self._checkin(conn, api)
+                raise
+            else:
+                self._checkin(conn, api)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            conn.disconnect()
+
+
+_router_pools = {}  # Router.id, or None for the MIKROTIK_HOST router -> RouterConnectionPool
+_router_pool_lock = threading.Lock()
+
+
+def get_router_pool(router_id=None):
+    """Returns the process-wide pool for a site, creating it on first use.
+
+    Registered sites are read from the routers table and need an app
+    context; `None` is the router configured by MIKROTIK_HOST.
+    """
+    pool = _router_pools.get(router_id)
+    if pool is None:
+        with _router_pool_lock:
+            pool = _router_pools.get(router_id)
+            if pool is None:
+                if router_id is None:
+                    pool = RouterConnectionPool.from_env()
+                else:
+                    router = db.session.get(Router, router_id)
+                    if router is None:
+                        raise RouterUnavailable(f"Unknown router {router_id}")
+                    pool = RouterConnectionPool.from_router(router)
+                _router_pools[router_id] = pool
+    return pool
+
+
+def close_router_pools():
+    with _router_pool_lock:
+        pools = list(_router_pools.values())
+        _router_pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+class RouterManager:
+    def __init__(self, router_id=None, pool=None):
+        self.router_id = router_id
+        self._pool = pool
+
+    @property
+    def pool(self):
+        # Resolved on first use so a missing site surfaces as a failed router call
+        if self._pool is None:
+            self._pool = get_router_pool(self.router_id)
+        return self._pool
 
     def authorize_mac(self, mac_address, ip_address, comment=""):
         """Bypasses a device in the hotspot using its MAC address."""
-        api = self.get_api()
         try:
-            ip_bindings = api.get_resource('/ip/hotspot/ip-binding')
-            ip_bindings.add(
-                mac_address=mac_address,
-                address=ip_address,
-                to_address=ip_address,
-                type='bypassed',
-                comment=comment
-            )
+            with self.pool.api() as api:
+                ip_bindings = api.get_resource('/ip/hotspot/ip-binding')
+                ip_bindings.add(
+                    mac_address=mac_address,
+                    address=ip_address,
+                    to_address=ip_address,
+                    type='bypassed',
+                    comment=comment
+                )
             print(f"Successfully authorized MAC: {mac_address}")
             return True
         except Exception as e:
@@ -50,19 +214,69 @@ class RouterManager:
 
     def remove_authorization(self, mac_address):
         """Removes a bypassed device to terminate its session."""
-        api = self.get_api()
         try:
-            ip_bindings = api.get_resource('/ip/hotspot/ip-binding')
-            binding = ip_bindings.get(mac_address=mac_address)
-            if binding:
-                ip_bindings.remove(id=binding[0]['id'])
-                print(f"Successfully removed authorization for MAC: {mac_address}")
+            with self.pool.api() as api:
+                ip_bindings = api.get_resource('/ip/hotspot/ip-binding')
+                binding = ip_bindings.get(mac_address=mac_address)
+                if binding:
+                    ip_bindings.remove(id=binding[0]['id'])
+                    print(f"Successfully removed authorization for MAC: {mac_address}")
             return True
         except Exception as e:
             print(f"Failed to remove authorization for MAC {mac_address}: {e}")
             return False
 
-    def disconnect(self):
-        """Disconnects the pool."""
-        if self.api_pool:
-            self.api_pool.disconnect()
\ No newline at end of file
+    def get_bindings(self):
+        """Reads the whole ip-binding table once and returns {MAC: [binding ids]}."""
+        with self.pool.api() as api:
+            ip_bindings = api.get_resource('/ip/hotspot/ip-binding')
+            rows = ip_bindings.call('print', {'proplist': '.id,mac-address'})
+
+        bindings = {}
+        for row in rows:
+            mac = row.get('mac-address')
+            if mac:
+                bindings.setdefault(mac.upper(), []).append(row['id'])
+        return bindings
+
+    def get_host_counters(self):
+        """Reads every hotspot host's byte counters in one print; returns {MAC: (bytes_in, bytes_out)}."""
+        with self.pool.api() as api:
+            hosts = api.get_resource('/ip/hotspot/host')
+            rows = hosts.call('print', {'proplist': 'mac-address,bytes-in,bytes-out'})
+
+        counters = {}
+        for row in rows:
+            mac = row.get('mac-address')
+            if mac:
+                counters[mac.upper()] = (int(row.get('bytes-in', 0)), int(row.get('bytes-out', 0)))
+        return counters
+
+    def find_bindings(self, mac_addresses):
+        """Looks up the bindings of a few MACs with pipelined filtered prints; returns {MAC: [binding ids]}."""
+        macs = sorted({mac.upper() for mac in mac_addresses})
+        with self.pool.api() as api:
+            ip_bindings = api.get_resource('/ip/hotspot/ip-binding')
+            pending = [(mac, ip_bindings.call_async('print', {'proplist': '.id'}, {'mac_address': mac}))
+                       for mac in macs]
+            return {mac: [row['id'] for row in promise.get()] for mac, promise in pending}
+
+    def remove_bindings(self, binding_ids):
+        """Removes bindings by id, pipelining every remove over a single session."""
+        if not binding_ids:
+            return True
+        try:
+            with self.pool.api() as api:
+                ip_bindings = api.get_resource('/ip/hotspot/ip-binding')
+                pending = [ip_bindings.remove_async(id=binding_id) for binding_id in binding_ids]
+                for promise in pending:
+                    try:
+                        promise.get()
+                    except RouterOsApiCommunicationError as e:
+                        # Already gone (removed by hand or by another sweep)
+                        print(f"Binding removal skipped: {e}")
+            print(f"Removed {len(binding_ids)} ip-bindings")
+            return True
+        except Exception as e:
+            print(f"Failed to remove ip-bindings: {e}")
+            return False
@@ -0,0 +1,107 @@
+from flask import make_response
+from datetime import date, datetime
+from decimal import Decimal
+from models import db, User, Bundle, Transaction, TransactionArchive, Session, HourlyRollup, DailyRollup
+import json
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used without it
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()  # orjson encodes these itself, in the same format
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+if orjson is not None:
+    def dumps(data):
+        """Encodes to JSON bytes; datetimes as ISO 8601, Decimals as strings."""
+        return orjson.dumps(data, default=_default)
+else:
+    _encoder = json.JSONEncoder(default=_default, separators=(',', ':'))
+
+    def dumps(data):
+        """Encodes to JSON bytes; datetimes as ISO 8601, Decimals as strings."""
+        return _encoder.encode(data).encode()
+
+
+def output_json(data, code, headers=None):
+    """flask-restful representation for application/json using `dumps`."""
+    response = make_response(dumps(data), code)
+    response.headers.extend(headers or {})
+    response.mimetype = 'application/json'
+    return response
+
+
+class Schema:
+    """The columns an API object is built from, and how to turn query rows into it.
+
+    Query `schema.columns` and pass the rows to `dump`/`dump_many`; each
+    row becomes a dict keyed by column name without loading ORM objects or
+    formatting values, which `dumps` does while encoding.
+    """
+
+    def __init__(self, *columns):
+        self.columns = columns
+        self.fields = tuple(column.key for column in columns)
+
+    def query(self):
+        return db.session.query(*self.columns)
+
+    def first(self, *criteria):
+        """The one matching row, dumped, or None."""
+        row = self.query().filter(*criteria).first()
+        return None if row is None else self.dump(row)
+
+    def dump(self, row):
+        return dict(zip(self.fields, row))
+
+    def dump_many(self, rows):
+        fields = self.fields
+        return [dict(zip(fields, row)) for row in rows]
+
+    def dump_object(self, obj):
+        """For an instance that is already loaded for another reason."""
+        return {field: getattr(obj, field) for field in self.fields}
+
+
+BUNDLE = Schema(
+    Bundle.id, Bundle.name, Bundle.data_amount, Bundle.duration, Bundle.duration_seconds,
+    Bundle.data_cap_bytes, Bundle.price, Bundle.created_at
+)
+
+SESSION = Schema(
+    Session.id, Session.user_id, Session.bundle_id, Session.session_token, Session.is_active,
+    Session.transaction_id, Session.created_at, Session.expires_at
+)
+
+TRANSACTION = Schema(
+    Transaction.id, Transaction.user_id, Transaction.bundle_id, Transaction.mpesa_code,
+    Transaction.amount, Transaction.status, Transaction.created_at
+)
+
+TRANSACTION_ARCHIVE = Schema(*[getattr(TransactionArchive, field) for field in TRANSACTION.fields])
+
+TRANSACTION_LISTING = Schema(
+    Transaction.id,
+    Transaction.user_id,
+    db.select(Session.id).where(
+        Session.transaction_id == Transaction.id
+    ).limit(1).scalar_subquery().label('session_id'),
+    Transaction.amount,
+    Transaction.status,
+    Transaction.created_at
+)
+
+USER = Schema(User.id, User.username, User.phone, User.email, User.created_at)
+
+LOGIN_USER = Schema(User.id, User.username, User.email, User.phone)
+
+HOURLY_ROLLUP, DAILY_ROLLUP = (Schema(
+    model.bucket, model.bundle_id, model.router_id, model.status,
+    model.transactions, model.revenue, model.bytes_used
+) for model in (HourlyRollup, DailyRollup))
@@ -4,42 +4,43 @@ from flask_jwt_extended import jwt_required
 from models import Session, Transaction, db
 from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime
+from resources.pagination import page_args, keyset_page, int_arg
+from resources.serializers import SESSION
 
 class SessionsResource(Resource):
     @jwt_required()
-    def get(self):
+    def get(self, session_id=None, user_id=None):
+        if session_id is not None:
+            return self.get_session(session_id)
+
+        try:
+            args = page_args()
+            user_id = user_id if user_id is not None else int_arg('user_id')
+        except ValueError as e:
+            return {'message': str(e)}, 400
+
         try:
-            sessions = Session.query.all()
-            sessions_list = [{
-                'id': session.id,
-                'user_id': session.user_id,
-                'bundle_id': session.bundle_id,
-                'session_token': session.session_token,
-                'is_active': session.is_active,
-                'transaction_id': session.transaction_id,
-                'created_at': session.created_at.isoformat(),
-                'expires_at': session.expires_at.isoformat()
-            } for session in sessions]
-            return {'sessions': sessions_list}, 200
+            query = SESSION.query()
+            if 'is_active' in request.args:
+                query = query.filter(Session.is_active == (request.args['is_active'].lower() in ('1', 'true')))
+            if user_id is not None:
+                query = query.filter(Session.user_id == user_id)
+            if args['date_from']:
+                query = query.filter(Session.created_at >= args['date_from'])
+            if args['date_to']:
+                query = query.filter(Session.created_at < args['date_to'])
+
+            sessions, next_cursor = keyset_page(query, Session.id, args['limit'], args['cursor'])
+            return {'sessions': SESSION.dump_many(sessions), 'next_cursor': next_cursor}, 200
         except SQLAlchemyError as e:
             return {'message': 'An error occurred while fetching sessions.', 'error': str(e)}, 500
         
     @jwt_required()
     def get_session(self, session_id):
         try:
-            session = Session.query.get(session_id)
-            if not session:
+            session_data = SESSION.first(Session.id == session_id)
+            if not session_data:
                 return {'message': 'Session not found'}, 404
-            session_data = {
-                'id': session.id,
-                'user_id': session.user_id,
-                'bundle_id': session.bundle_id,
-                'session_token': session.session_token,
-                'is_active': session.is_active,
-                'transaction_id': session.transaction_id,
-                'created_at': session.created_at.isoformat(),
-                'expires_at': session.expires_at.isoformat()
-            }
             return {'session': session_data}, 200
         except SQLAlchemyError as e:
             return {'message': 'An error occurred while fetching the session.', 'error': str(e)}, 500
@@ -47,18 +48,8 @@ class SessionsResource(Resource):
     @jwt_required()
     def user_sessions(self, user_id):
         try:
-            sessions = Session.query.filter_by(user_id=user_id).all()
-            sessions_list = [{
-                'id': session.id,
-                'user_id': session.user_id,
-                'bundle_id': session.bundle_id,
-                'session_token': session.session_token,
-                'is_active': session.is_active,
-                'transaction_id': session.transaction_id,
-                'created_at': session.created_at.isoformat(),
-                'expires_at': session.expires_at.isoformat()
-            } for session in sessions]
-            return {'sessions': sessions_list}, 200
+            sessions = SESSION.query().filter(Session.user_id == user_id).all()
+            return {'sessions': SESSION.dump_many(sessions)}, 200
         except SQLAlchemyError as e:
             return {'message': 'An error occurred while fetching user sessions.', 'error': str(e)}, 500
         
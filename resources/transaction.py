@@ -1,47 +1,53 @@
-from models import Transaction
+from models import Transaction, TransactionArchive
+from flask import request
 from flask_jwt_extended import jwt_required
 from flask_restful import Resource
+from resources.pagination import page_args, keyset_page, int_arg
+from resources.serializers import TRANSACTION, TRANSACTION_ARCHIVE, TRANSACTION_LISTING
 
 
 class TransactionsResource(Resource):
     @jwt_required()
-    def get(self):
-        transactions = Transaction.query.all()
+    def get(self, transaction_id=None, user_id=None):
+        if transaction_id is not None:
+            return self.transaction_details(transaction_id)
 
-        return [{
-            "id": transaction.id,
-            "user_id": transaction.user_id,
-            "session_id": transaction.session.id if transaction.session else None,
-            "amount": str(transaction.amount),
-            "status": transaction.status,
-            "created_at": transaction.created_at.isoformat()
-        } for transaction in transactions], 200
+        try:
+            args = page_args()
+            user_id = user_id if user_id is not None else int_arg('user_id')
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
+        query = TRANSACTION_LISTING.query()
+
+        status = request.args.get('status')
+        if status:
+            query = query.filter(Transaction.status == status)
+        if user_id is not None:
+            query = query.filter(Transaction.user_id == user_id)
+        if args['date_from']:
+            query = query.filter(Transaction.created_at >= args['date_from'])
+        if args['date_to']:
+            query = query.filter(Transaction.created_at < args['date_to'])
+
+        rows, next_cursor = keyset_page(query, Transaction.id, args['limit'], args['cursor'])
+
+        return {
+            "transactions": TRANSACTION_LISTING.dump_many(rows),
+            "next_cursor": next_cursor
+        }, 200
     
     @jwt_required()
     def user_transactions(self, user_id):
-        transactions = Transaction.query.filter_by(user_id=user_id).all()
-        
-        return [{
-            "id": transaction.id,
-            "user_id": transaction.user_id,
-            "amount": str(transaction.amount),
-            "status": transaction.status,
-            "created_at": transaction.created_at.isoformat()
-        } for transaction in transactions], 200
+        transactions = TRANSACTION.query().filter(Transaction.user_id == user_id).all()
+        return TRANSACTION.dump_many(transactions), 200
     
     @jwt_required()
     def transaction_details(self, transaction_id):
-        transaction = Transaction.query.get(transaction_id)
+        # Finished transactions move to the archive after ARCHIVE_AFTER_DAYS
+        transaction = TRANSACTION.first(Transaction.id == transaction_id) \
+            or TRANSACTION_ARCHIVE.first(TransactionArchive.id == transaction_id)
         if not transaction:
             return {"message": "Transaction not found"}, 404
-        
-        return {
-            "id": transaction.id,
-            "user_id": transaction.user_id,
-            "bundle_id": transaction.bundle_id,
-            "mpesa_code": transaction.mpesa_code,
-            "amount": str(transaction.amount),
-            "status": transaction.status,
-            "created_at": transaction.created_at.isoformat()
-        }, 200
+        return transaction, 200
     
@@ -2,26 +2,23 @@ from flask_restful import Resource
 from flask import request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db
-from models import User
+from models import User, Session, Transaction
 from sqlalchemy.exc import SQLAlchemyError
+from hashing import HasherBusy
+from resources.serializers import USER
 import bleach
 
 class UserResource(Resource):
     @jwt_required()
     def get(self, user_id):
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = USER.first(User.id == user_id)
         if not user:
             return {"message": "User not found"}, 404
-        return {
-            "id": user.id,
-            "username": user.username,
-            "phone": user.phone,
-            "email": user.email,
-            "sessions": [session.id for session in user.sessions],
-            "transactions": [transaction.id for transaction in user.transactions],
-            "created_at": user.created_at.isoformat()
-        }, 200
+        # ids only; loading the relationships would build every row as an object
+        user["sessions"] = [session_id for (session_id,) in db.session.query(Session.id).filter_by(user_id=user_id)]
+        user["transactions"] = [tx_id for (tx_id,) in db.session.query(Transaction.id).filter_by(user_id=user_id)]
+        return user, 200
        
     @jwt_required()
     def patch(self):
@@ -35,7 +32,9 @@ class UserResource(Resource):
         required_fields = ['username', 'phone', 'email', 'password']
         for field in required_fields:
             if field in data:
-                setattr(user, field, data[field])
+                if field != 'password':
+                    # The password setter hashes; run it only once, below
+                    setattr(user, field, data[field])
                 try:
                     if field == 'email':
                         user.email = bleach.clean(data['email'])
@@ -45,6 +44,8 @@ class UserResource(Resource):
                         user.phone = bleach.clean(data['phone'])
                     elif field == 'password':
                         user.password = data['password']
+                except HasherBusy:
+                    return {'message': 'Server busy, please try again'}, 503, {'Retry-After': '2'}
                 except SQLAlchemyError as e:
                     db.session.rollback()
                     return {'message': 'Error updating user', 'error': str(e)}, 500
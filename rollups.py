@@ -0,0 +1,124 @@
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Transaction, HourlyRollup, DailyRollup
+
+# Later lifecycle states of a paid purchase are reported as the payment they were
+SETTLED_STATUS = {'expired': 'completed', 'capped': 'completed'}
+
+
+def rollup_key(at, bundle_id, router_id, status):
+    """(hour, bundle_id, router_id, status) for a fact at UTC `at`; the default router is 0.
+
+    Buckets are UTC hours and days, whatever the host's timezone.
+    """
+    return (at.replace(minute=0, second=0, microsecond=0), bundle_id, router_id or 0,
+            SETTLED_STATUS.get(status, status))
+
+
+def apply_rollups(increments):
+    """Adds {rollup_key: [transactions, revenue, bytes_used]} to the hourly and daily tables.
+
+    Runs in the caller's DB transaction, so the rollups move together with
+    whatever made the facts. Rows are upserted in key order to keep
+    concurrent writers from deadlocking on each other.
+    """
+    if not increments:
+        return
+    daily = defaultdict(lambda: [0, Decimal(0), 0])
+    for (hour, bundle_id, router_id, status), values in increments.items():
+        total = daily[(hour.replace(hour=0), bundle_id, router_id, status)]
+        for i, value in enumerate(values):
+            total[i] += value
+
+    for model, rows in ((HourlyRollup, increments), (DailyRollup, daily)):
+        values = [{
+            'bucket': bucket, 'bundle_id': bundle_id, 'router_id': router_id, 'status': status,
+            'transactions': count, 'revenue': revenue, 'bytes_used': bytes_used,
+        } for (bucket, bundle_id, router_id, status), (count, revenue, bytes_used) in sorted(rows.items())]
+        dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+        stmt = dialect.insert(model).values(values)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['bucket', 'bundle_id', 'router_id', 'status'],
+            set_={column: getattr(model, column) + getattr(stmt.excluded, column)
+                  for column in ('transactions', 'revenue', 'bytes_used')}
+        ))
+
+
+def local_to_utc(at):
+    """Naive UTC for a naive local time such as Transaction.created_at."""
+    return at.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def record_settlement(transaction):
+    """Counts a transaction that just left 'pending' in the rollups; the caller commits."""
+    transaction.settled_at = datetime.utcnow()
+    transaction.rolled_up = True
+    key = rollup_key(transaction.settled_at, transaction.bundle_id, transaction.router_id, transaction.status)
+    apply_rollups({key: [1, Decimal(transaction.amount), 0]})
+
+
+class RollupCatchUp:
+    """Counts settled transactions the callback path did not roll up.
+
+    That covers rows settled before the rollup tables existed and any
+    written by other paths. Data use is only counted as the usage collector
+    meters it, not here. `rolled_up` is the high-water mark: each row is
+    flagged in the same DB transaction that counts it, and the partial
+    index on unflagged rows means a run reads only rows not yet counted,
+    however large the transactions table is. A timestamp watermark would
+    skip rows whose settlement committed after a later one.
+    """
+
+    def __init__(self, batch_size=5000):
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_env(cls):
+        return cls(batch_size=int(os.environ.get('ROLLUP_BATCH_SIZE', 5000)))
+
+    def run(self, app):
+        """Rolls up every outstanding settled transaction; returns how many were counted."""
+        counted = 0
+        last_id = 0
+        with app.app_context():
+            while True:
+                rows = db.session.query(
+                    Transaction.id, Transaction.bundle_id, Transaction.router_id, Transaction.status,
+                    Transaction.amount, Transaction.settled_at, Transaction.created_at
+                ).filter(
+                    db.not_(Transaction.rolled_up),
+                    Transaction.status != 'pending',
+                    Transaction.id > last_id
+                ).order_by(Transaction.id).limit(self.batch_size).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+
+                increments = defaultdict(lambda: [0, Decimal(0), 0])
+                for row in rows:
+                    # settled_at is UTC; rows settled before it existed fall back to created_at, local time
+                    settled_at = row.settled_at or local_to_utc(row.created_at)
+                    total = increments[rollup_key(settled_at, row.bundle_id, row.router_id, row.status)]
+                    total[0] += 1
+                    total[1] += row.amount
+                apply_rollups(increments)
+                db.session.execute(db.update(Transaction).where(
+                    Transaction.id.in_([row.id for row in rows]),
+                    db.not_(Transaction.rolled_up)
+                ).values(rolled_up=True).execution_options(synchronize_session=False))
+                db.session.commit()
+                counted += len(rows)
+
+        if counted:
+            print(f"Rolled up {counted} settled transactions.")
+        return counted
+
+
+rollup_catch_up = RollupCatchUp.from_env()
+
+
+def catch_up_rollups(app):
+    rollup_catch_up.run(app)
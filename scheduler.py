@@ -1,34 +1,301 @@
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from apscheduler.schedulers.background import BackgroundScheduler
 from models import Transaction, db
 from resources.router import RouterManager
-from datetime import datetime
-from app import app  # Import your Flask app instance
+from leader import LeaderElection
+from reconciler import reconcile_pending_transactions
+from usage import collect_usage
+from rollups import catch_up_rollups
+from archive import archive_transactions
+from datetime import datetime, timedelta
 
-def cleanup_expired_sessions():
-    """Finds expired sessions and removes their MAC authorization from the router."""
+SWEEP_CHUNK_SIZE = int(os.environ.get('EXPIRY_SWEEP_CHUNK_SIZE', 500))
+
+# One sweep task per site at a time, so a slow router only holds up its own
+router_fanout = ThreadPoolExecutor(max_workers=int(os.environ.get('ROUTER_FANOUT_WORKERS', 8)),
+                                   thread_name_prefix='router-sweep')
+
+def revoke_expired(rows, now, router, bindings=None, status='expired'):
+    """Removes the router bindings for expired (id, mac_address) rows and marks them `status`.
+
+    All rows belong to `router`'s site. `bindings` is a {MAC: [binding ids]}
+    snapshot of its whole table; without one, only the MACs involved are
+    looked up. Returns False, leaving the rows completed, when the router
+    could not be reached.
+    """
+    # A MAC that bought a new bundle at the same site keeps its binding
+    expired_macs = {row.mac_address for row in rows}
+    still_active = {mac for (mac,) in db.session.query(Transaction.mac_address).filter(
+        Transaction.mac_address.in_(expired_macs),
+        Transaction.id.notin_([row.id for row in rows]),
+        Transaction.router_id == router.router_id,
+        Transaction.status == 'completed',
+        Transaction.expires_at >= now
+    )}
+    to_remove = {mac.upper() for mac in expired_macs - still_active}
+
+    try:
+        if bindings is None:
+            bindings = router.find_bindings(to_remove)
+    except Exception as e:
+        print(f"Could not read ip-bindings: {e}")
+        db.session.rollback()
+        return False
+    binding_ids = [binding_id for mac in to_remove for binding_id in bindings.pop(mac, [])]
+
+    if not router.remove_bindings(binding_ids):
+        db.session.rollback()
+        return False
+
+    Transaction.query.filter(
+        Transaction.id.in_([row.id for row in rows])
+    ).update({Transaction.status: status}, synchronize_session=False)
+    db.session.commit()
+    return True
+
+def sweep_router(app, router_id, now):
+    """Revokes every session at one site that expired before `now`; returns how many."""
+    with app.app_context():
+        router = RouterManager(router_id)
+        bindings = None
+        last_id = 0
+        cleaned = 0
+
+        while True:
+            chunk = db.session.query(Transaction.id, Transaction.mac_address).filter(
+                Transaction.expires_at < now,
+                Transaction.status == 'completed',
+                Transaction.router_id == router_id,
+                Transaction.id > last_id
+            ).order_by(Transaction.id).limit(SWEEP_CHUNK_SIZE).all()
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+
+            if bindings is None:
+                try:
+                    bindings = router.get_bindings()
+                except Exception as e:
+                    print(f"Session cleanup for router {router_id} aborted, could not read ip-bindings: {e}")
+                    break
+
+            if not revoke_expired(chunk, now, router, bindings):
+                print(f"Session cleanup for router {router_id} stopped, router removes failed; will retry next run.")
+                break
+            cleaned += len(chunk)
+        return cleaned
+
+def cleanup_expired_sessions(app):
+    """Finds expired sessions and removes their MAC authorization from their router.
+
+    Each site is swept concurrently on `router_fanout`. Per site, expired
+    transactions are walked in fixed-size chunks by id, the router's
+    ip-binding table is read once and matched in memory, and each chunk is
+    closed with a single bulk UPDATE.
+    """
     with app.app_context():
         print("Running session cleanup job...")
-        expired_transactions = Transaction.query.filter(
-            Transaction.expires_at < datetime.utcnow(),
+        now = datetime.utcnow()
+        router_ids = [router_id for (router_id,) in db.session.query(Transaction.router_id).filter(
+            Transaction.expires_at < now,
             Transaction.status == 'completed'
-        ).all()
+        ).distinct()]
+
+    futures = {router_fanout.submit(sweep_router, app, router_id, now): router_id for router_id in router_ids}
+    cleaned = 0
+    for future in as_completed(futures):
+        try:
+            cleaned += future.result()
+        except Exception as e:
+            print(f"Session cleanup for router {futures[future]} failed: {e}")
+
+    if cleaned:
+        print(f"Cleaned up {cleaned} expired sessions.")
+
+class ExpiryLane:
+    """Deadline heap and revoking thread for one site."""
+
+    def __init__(self, scheduler, router_id):
+        self.scheduler = scheduler
+        self.router_id = router_id
+        self._heap = []  # [(expires_at, transaction_id)]
+        self._scheduled = set()
+        self._cond = threading.Condition()
+        self._running = True
+        threading.Thread(target=self._run, name=f"expiry-{router_id}", daemon=True).start()
+
+    def push(self, transaction_id, expires_at):
+        with self._cond:
+            if transaction_id in self._scheduled:
+                return
+            self._scheduled.add(transaction_id)
+            heapq.heappush(self._heap, (expires_at, transaction_id))
+            if self._heap[0][1] == transaction_id:
+                self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
 
-        if not expired_transactions:
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = datetime.utcnow()
+                due = []
+                while self._heap and self._heap[0][0] <= now and len(due) < self.scheduler.batch_size:
+                    expires_at, transaction_id = heapq.heappop(self._heap)
+                    self._scheduled.discard(transaction_id)
+                    due.append(transaction_id)
+
+                if not due:
+                    timeout = (self._heap[0][0] - now).total_seconds() if self._heap else None
+                    self._cond.wait(timeout=timeout)
+                    continue
+
+            with self.scheduler.app.app_context():
+                try:
+                    self._revoke(due)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Expiry scheduler error for router {self.router_id}: {e}")
+                finally:
+                    db.session.remove()
+
+    def _revoke(self, transaction_ids):
+        now = datetime.utcnow()
+        # Re-read: the row may have been revoked elsewhere or its deadline moved
+        rows = db.session.query(Transaction.id, Transaction.mac_address, Transaction.expires_at).filter(
+            Transaction.id.in_(transaction_ids),
+            Transaction.status == 'completed'
+        ).all()
+        expired = [row for row in rows if row.expires_at <= now]
+        for row in rows:
+            if row.expires_at > now:
+                self.push(row.id, row.expires_at)
+        if not expired:
             return
 
-        router = RouterManager()
-        for tx in expired_transactions:
-            print(f"Expiring session for MAC: {tx.mac_address}")
-            router.remove_authorization(tx.mac_address)
-            tx.status = 'expired'
-
-        router.disconnect()
-        db.session.commit()
-        print(f"Cleaned up {len(expired_transactions)} expired sessions.")
-
-def start_scheduler():
-    scheduler = BackgroundScheduler()
-    # Run job every 5 minutes
-    scheduler.add_job(cleanup_expired_sessions, 'interval', minutes=5)
-    scheduler.start()
-    print("Scheduler started.")
\ No newline at end of file
+        if revoke_expired(expired, now, RouterManager(self.router_id)):
+            print(f"Revoked {len(expired)} expired sessions on router {self.router_id}.")
+        else:
+            print(f"Router {self.router_id} unavailable, retrying {len(expired)} revocations later.")
+            for row in expired:
+                self.push(row.id, now + self.scheduler.retry_delay)
+
+class ExpiryScheduler:
+    """Revokes sessions when they expire instead of polling for them.
+
+    Each site gets an ExpiryLane: a min-heap of upcoming expires_at
+    deadlines and a thread that sleeps until the earliest one is due, then
+    revokes what is due in small batches. A slow or unreachable router only
+    delays its own lane. Callbacks completed in this process are pushed
+    straight in. Every `refresh_interval` seconds the lanes are topped up
+    from the DB with deadlines inside the next `lookahead`, which catches
+    completions made by other processes. That query is a range read on the
+    partial expires_at index, not a scan, and returns nothing while nothing
+    is close to expiring.
+    """
+
+    def __init__(self, batch_size=50, refresh_interval=30, retry_delay=30):
+        self.batch_size = batch_size
+        self.refresh_interval = refresh_interval
+        self.lookahead = timedelta(seconds=refresh_interval * 2)
+        self.retry_delay = timedelta(seconds=retry_delay)
+
+        self.app = None
+        self._lanes = {}  # router_id -> ExpiryLane
+        self._lock = threading.Lock()
+        self._stop = None
+
+    def start(self, app):
+        with self._lock:
+            if self._stop is not None:
+                return
+            self.app = app
+            self._stop = threading.Event()
+            stop = self._stop
+        threading.Thread(target=self._refresh_loop, args=(stop,), name="expiry-refresh", daemon=True).start()
+        print("Expiry scheduler started.")
+
+    def stop(self):
+        with self._lock:
+            stop, self._stop = self._stop, None
+            lanes, self._lanes = self._lanes, {}
+        if stop is not None:
+            stop.set()
+        for lane in lanes.values():
+            lane.stop()
+
+    def schedule(self, transaction_id, expires_at, router_id=None):
+        """Registers a deadline; a no-op in processes that do not run the scheduler."""
+        with self._lock:
+            if self._stop is None:
+                return
+            lane = self._lanes.get(router_id)
+            if lane is None:
+                lane = self._lanes[router_id] = ExpiryLane(self, router_id)
+        lane.push(transaction_id, expires_at)
+
+    def _refresh_loop(self, stop):
+        while not stop.is_set():
+            with self.app.app_context():
+                try:
+                    self._refresh()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Expiry scheduler error: {e}")
+            stop.wait(self.refresh_interval)
+
+    def _refresh(self):
+        upcoming = db.session.query(Transaction.id, Transaction.expires_at, Transaction.router_id).filter(
+            Transaction.status == 'completed',
+            Transaction.expires_at <= datetime.utcnow() + self.lookahead
+        ).all()
+        for row in upcoming:
+            self.schedule(row.id, row.expires_at, row.router_id)
+
+expiry_scheduler = ExpiryScheduler(
+    batch_size=int(os.environ.get('EXPIRY_BATCH_SIZE', 50)),
+    refresh_interval=int(os.environ.get('EXPIRY_REFRESH_SECONDS', 30)),
+)
+
+_background = None
+
+def start_scheduler(app):
+    global _background
+    expiry_scheduler.start(app)
+    _background = BackgroundScheduler()
+    # Full sweep as a safety net for anything the deadline scheduler missed
+    _background.add_job(cleanup_expired_sessions, 'interval', args=[app],
+                        minutes=int(os.environ.get('EXPIRY_SWEEP_MINUTES', 30)))
+    # Settle purchases whose callback never arrived
+    _background.add_job(reconcile_pending_transactions, 'interval', args=[app],
+                        seconds=int(os.environ.get('RECONCILE_INTERVAL_SECONDS', 60)))
+    # Meter data use and revoke purchases over their cap
+    _background.add_job(collect_usage, 'interval', args=[app],
+                        seconds=int(os.environ.get('USAGE_POLL_SECONDS', 60)))
+    # Count settlements the callback path did not roll up
+    _background.add_job(catch_up_rollups, 'interval', args=[app],
+                        seconds=int(os.environ.get('ROLLUP_INTERVAL_SECONDS', 300)))
+    # Move finished transactions out of the live table
+    _background.add_job(archive_transactions, 'interval', args=[app],
+                        minutes=int(os.environ.get('ARCHIVE_INTERVAL_MINUTES', 60)))
+    _background.start()
+    print("Scheduler started.")
+
+def stop_scheduler():
+    global _background
+    expiry_scheduler.stop()
+    if _background is not None:
+        _background.shutdown(wait=False)
+        _background = None
+    print("Scheduler stopped.")
+
+# Only the elected process runs the jobs; see leader.py
+job_leader = LeaderElection.from_env('scheduler', on_elected=start_scheduler, on_demoted=stop_scheduler)
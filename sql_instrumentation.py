@@ -0,0 +1,85 @@
+import os
+import re
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from metrics import metrics
+
+
+def tidy(statement):
+    """The statement on one line."""
+    return re.sub(r'\s+', ' ', statement).strip()
+
+
+class SQLInstrumentation:
+    """Per-request SQL accounting built on engine cursor events.
+
+    Every request gets its query count, total DB time and slowest statement.
+    Statements over the slow threshold are printed with their bind values
+    redacted, and so is a summary of any request whose DB time adds up to
+    more than the threshold, naming its slowest statement. With
+    SQL_SERVER_TIMING set, the numbers also go back to the client in a
+    Server-Timing header.
+    """
+
+    statement_chars = 200  # of the slowest statement in a request summary
+
+    def __init__(self, app=None):
+        self.slow_ms = 200.0
+        self.server_timing = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.slow_ms = float(os.environ.get('SQL_SLOW_QUERY_MS', 200))
+        self.server_timing = os.environ.get('SQL_SERVER_TIMING', 'false').lower() == 'true'
+
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+
+        if has_request_context() and 'sql_stats' in g:
+            stats = g.sql_stats
+            stats['count'] += 1
+            stats['total'] += elapsed
+            if elapsed > stats['slowest']:
+                stats['slowest'] = elapsed
+                stats['slowest_statement'] = statement  # tidied only if it is logged
+
+        if elapsed * 1000 >= self.slow_ms:
+            metrics.incr('sql_slow_queries')
+            param_count = len(parameters) if isinstance(parameters, (list, tuple, dict)) else 0
+            # The statement carries placeholders only; bind values never reach the log
+            print(f"Slow query ({elapsed * 1000:.1f}ms, {param_count} params redacted): {tidy(statement)}")
+
+    def _start_request(self):
+        g.sql_stats = {'count': 0, 'total': 0.0, 'slowest': 0.0, 'slowest_statement': None}
+
+    def _finish_request(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+
+        metrics.observe('sql_time_per_request_seconds', stats['total'])
+        metrics.incr('sql_queries', stats['count'])
+        if stats['total'] * 1000 >= self.slow_ms:
+            slowest = tidy(stats['slowest_statement'] or '')
+            if len(slowest) > self.statement_chars:
+                slowest = slowest[:self.statement_chars] + '...'
+            print(f"Slow request {request.method} {request.path}: {stats['count']} queries, "
+                  f"{stats['total'] * 1000:.1f}ms in DB; slowest {stats['slowest'] * 1000:.1f}ms: {slowest}")
+        if self.server_timing:
+            response.headers.add(
+                'Server-Timing',
+                f'db;dur={stats["total"] * 1000:.1f};desc="{stats["count"]} queries", '
+                f'db-slowest;dur={stats["slowest"] * 1000:.1f}'
+            )
+        return response
@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py reads its configuration at import time
+os.environ.update({
+    'DATABASE_URL': os.environ.get('TEST_DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/test.db"),
+    'ENVIRONMENT': 'test',
+    'SECRET_KEY': 'test-secret-key-test-secret-key-test',
+    'MPESA_CONSUMER_KEY': 'key',
+    'MPESA_CONSUMER_SECRET': 'secret',
+    'MPESA_SHORTCODE': '174379',
+    'MPESA_PASSKEY': 'passkey',
+    'BASE_URL': 'http://127.0.0.1:5000',
+    'BACKGROUND_JOBS': 'false',
+})
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app
+    from callback_queue import callback_queue
+    # Tests apply callbacks by hand instead of through the worker threads
+    callback_queue._started = True
+    return app
+
+
+@pytest.fixture
+def db(app):
+    from models import db
+    with app.app_context():
+        db.create_all()
+        yield db
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(db):
+    from flask_jwt_extended import create_access_token
+    from models import User
+    user = User(username='test', phone='0700000000', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
@@ -0,0 +1,46 @@
+import pytest
+
+from hashing import HasherBusy, hash_password, password_hasher
+from models import User
+from rate_limits import limiter
+
+
+@pytest.fixture
+def old_rounds_user(db):
+    limiter.reset()  # login is limited per address, and every test client shares one
+    # A hash made with a cost other than the configured one is upgraded on login
+    user = User(username='old', phone='0711111111', email='old@example.com',
+                password_hash=hash_password('correct-horse', password_hasher.rounds - 1))
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def login(client):
+    return client.post('/auth/login', json={'email': 'old@example.com', 'password': 'correct-horse'})
+
+
+def test_login_upgrades_an_old_hash(client, db, old_rounds_user):
+    response = login(client)
+    assert response.status_code == 200
+    assert not db.session.get(User, old_rounds_user).password_needs_rehash()
+
+
+def test_shed_rehash_still_logs_in(client, db, old_rounds_user, monkeypatch):
+    def busy(password):
+        raise HasherBusy("Too many password checks in progress")
+    monkeypatch.setattr(password_hasher, 'hash', busy)
+
+    response = login(client)
+    assert response.status_code == 200
+    assert response.get_json()['access_token']
+    assert db.session.get(User, old_rounds_user).password_needs_rehash()
+
+
+def test_shed_verify_is_a_503(client, db, old_rounds_user, monkeypatch):
+    def busy(password_hash, password):
+        raise HasherBusy("Too many password checks in progress")
+    monkeypatch.setattr(password_hasher, 'verify', busy)
+
+    response = login(client)
+    assert response.status_code == 503
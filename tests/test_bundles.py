@@ -0,0 +1,27 @@
+import gzip
+import json
+
+from models import Bundle
+from resources.bundles import bundle_catalogue
+
+
+def test_gzip_and_identity_bodies_have_their_own_etag(client, db):
+    db.session.add(Bundle(name='1 hour', data_amount='1 GB', duration='1 hours', price=10))
+    db.session.commit()
+    bundle_catalogue.invalidate()
+
+    plain = client.get('/bundles', headers={'Accept-Encoding': 'identity'})
+    zipped = client.get('/bundles', headers={'Accept-Encoding': 'gzip'})
+    assert json.loads(gzip.decompress(zipped.data)) == plain.get_json()
+    assert plain.headers['ETag'] != zipped.headers['ETag']
+    assert zipped.headers['Vary'] == 'Accept-Encoding'
+
+    # Each tag only revalidates its own representation
+    assert client.get('/bundles', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': zipped.headers['ETag']}).status_code == 304
+    assert client.get('/bundles', headers={
+        'Accept-Encoding': 'identity', 'If-None-Match': plain.headers['ETag']}).status_code == 304
+    assert client.get('/bundles', headers={
+        'Accept-Encoding': 'identity', 'If-None-Match': zipped.headers['ETag']}).status_code == 200
+    assert client.get('/bundles', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': plain.headers['ETag']}).status_code == 200
@@ -0,0 +1,32 @@
+import json
+
+from callback_queue import CallbackQueue
+from models import MpesaCallback
+
+
+def store_callback(db, checkout_request_id, result_code=1032):
+    callback = MpesaCallback(checkout_request_id=checkout_request_id, payload=json.dumps({'Body': {'stkCallback': {
+        'CheckoutRequestID': checkout_request_id, 'ResultCode': result_code, 'ResultDesc': 'Request cancelled by user'
+    }}}))
+    db.session.add(callback)
+    db.session.commit()
+    return callback.id
+
+
+def test_callback_without_transaction_is_retried_then_orphaned(app, db):
+    queue = CallbackQueue(max_attempts=2)
+    queue.app = app
+    callback_id = store_callback(db, 'ws_CO_unknown')
+
+    queue._process(callback_id)
+    callback = db.session.get(MpesaCallback, callback_id)
+    assert callback.status == 'pending'
+    assert 'ws_CO_unknown' in callback.last_error
+
+    callback.next_attempt_at = None
+    db.session.commit()
+    queue._process(callback_id)
+    callback = db.session.get(MpesaCallback, callback_id)
+    assert callback.status == 'orphaned'
+    assert callback.processed_at is None
+    assert callback.last_error == 'No transaction for CheckoutRequestID ws_CO_unknown'
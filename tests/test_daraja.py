@@ -0,0 +1,100 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+from loadtest.fake_daraja import FakeDaraja
+from resources.daraja import DarajaClient, DarajaError, DarajaUnavailable, stk_credentials
+
+
+@pytest.fixture
+def daraja():
+    # Callbacks are never posted back; these tests only look at the API calls
+    server = FakeDaraja(callback_delay=0, callback_loss_rate=1.0).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(daraja, **kwargs):
+    kwargs.setdefault('backoff_base', 0.01)
+    return DarajaClient(daraja.base_url, 'key', 'secret', **kwargs)
+
+
+def stk_payload():
+    return dict(stk_credentials(), Amount=10, PhoneNumber='254700000000',
+                CallBackURL='http://127.0.0.1:9/mpesa/callback')
+
+
+def test_concurrent_pushes_share_one_token_fetch(daraja):
+    daraja.latency = 0.05  # keep the first fetch in flight while the others arrive
+    client = make_client(daraja)
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        responses = list(executor.map(lambda _: client.stk_push(stk_payload()), range(20)))
+    assert all(response['ResponseCode'] == '0' for response in responses)
+    assert daraja.hits['oauth'] == 1
+    assert daraja.hits['stkpush'] == 20
+
+
+def test_token_is_refreshed_before_expiry(daraja):
+    daraja.token_ttl = 1
+    client = make_client(daraja)
+    client.tokens.refresh_margin = 0.5
+    client.stk_push(stk_payload())
+    client.stk_push(stk_payload())
+    assert daraja.hits['oauth'] == 1
+    time.sleep(0.6)
+    client.stk_push(stk_payload())
+    assert daraja.hits['oauth'] == 2
+
+
+def test_rejected_token_is_refreshed_once(daraja):
+    client = make_client(daraja)
+    client.stk_push(stk_payload())
+    daraja.token = 'rotated-token'  # revoked on Safaricom's side before its expires_in
+    assert client.stk_push(stk_payload())['ResponseCode'] == '0'
+    assert daraja.hits['unauthorized'] == 1
+    assert daraja.hits['oauth'] == 2
+
+
+def test_breaker_opens_after_repeated_failures(daraja):
+    client = make_client(daraja, failure_threshold=3, reset_timeout=60)
+    client.access_token()
+    daraja.error_rate = 1.0
+    for _ in range(3):
+        with pytest.raises(DarajaError):
+            client.stk_push(stk_payload())
+    assert client.breaker.state == 'open'
+    with pytest.raises(DarajaUnavailable):
+        client.stk_push(stk_payload())
+    assert daraja.hits['stkpush'] == 3
+
+
+def test_breaker_half_opens_for_one_trial_call(daraja):
+    client = make_client(daraja, failure_threshold=1, reset_timeout=0.2)
+    client.access_token()
+    daraja.error_rate = 1.0
+    with pytest.raises(DarajaError):
+        client.stk_push(stk_payload())
+    time.sleep(0.25)
+    assert client.breaker.state == 'half-open'
+
+    # A failed trial opens the circuit again
+    with pytest.raises(DarajaError):
+        client.stk_push(stk_payload())
+    assert client.breaker.state == 'open'
+    time.sleep(0.25)
+
+    # While the trial is in flight every other call is short-circuited
+    daraja.error_rate = 0.0
+    daraja.latency = 0.3
+    trial = []
+    thread = threading.Thread(target=lambda: trial.append(client.stk_push(stk_payload())))
+    thread.start()
+    time.sleep(0.1)
+    with pytest.raises(DarajaUnavailable):
+        client.stk_push(stk_payload())
+    thread.join()
+    assert trial[0]['ResponseCode'] == '0'
+    assert client.breaker.state == 'closed'
+    assert daraja.hits['stkpush'] == 3
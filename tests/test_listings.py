@@ -0,0 +1,75 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+
+from models import Bundle, Session, Transaction, User
+
+
+@contextmanager
+def count_queries(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def add_purchases(db, user_id, count):
+    bundle = Bundle.query.first()
+    if bundle is None:
+        bundle = Bundle(name='1 hour', data_amount='1 GB', duration='1 hours', price=10)
+        db.session.add(bundle)
+        db.session.flush()
+    start = Transaction.query.count()
+    for i in range(start, start + count):
+        transaction = Transaction(user_id=user_id, bundle_id=bundle.id, amount=10, status='completed',
+                                  mac_address='02:00:00:00:00:01', ip_address='10.0.0.1')
+        db.session.add(transaction)
+        db.session.flush()
+        db.session.add(Session(user_id=user_id, bundle_id=bundle.id, transaction_id=transaction.id,
+                               session_token=f'token-{i}', expires_at=datetime.now() + timedelta(hours=1)))
+    db.session.commit()
+
+
+@pytest.mark.parametrize('url', [
+    '/transactions?user_id=abc',
+    '/transactions?cursor=abc',
+    '/transactions?limit=ten',
+    '/sessions?user_id=1.5',
+    '/transactions/export?user_id=abc',
+    '/reports?bundle_id=abc',
+    '/reports?router_id=',
+])
+def test_malformed_integer_filters_are_rejected(client, auth_headers, url):
+    response = client.get(url, headers=auth_headers)
+    assert response.status_code == 400
+    assert 'must be an integer' in response.get_json()['message']
+
+
+def test_export_ignores_paging_arguments(client, db, auth_headers):
+    add_purchases(db, User.query.one().id, 3)
+    # A listing URL with its paging arguments, reused for an export
+    response = client.get('/transactions/export?limit=ten&cursor=stale&format=ndjson', headers=auth_headers)
+    assert response.status_code == 200
+    assert len(response.data.splitlines()) == 3
+
+
+@pytest.mark.parametrize('path', ['/transactions', '/users/{user_id}', '/sessions'])
+def test_listing_query_count_does_not_grow_with_rows(client, db, auth_headers, path):
+    user_id = User.query.one().id
+    url = path.format(user_id=user_id)
+    counts = []
+    for rows in (3, 30):
+        add_purchases(db, user_id, rows - Transaction.query.count())
+        db.session.remove()
+        with count_queries(db.engine) as statements:
+            response = client.get(url, headers=auth_headers)
+        assert response.status_code == 200
+        counts.append(len(statements))
+    assert counts[0] == counts[1], f"{url} ran {counts[0]} statements for 3 rows and {counts[1]} for 30"
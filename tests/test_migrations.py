@@ -0,0 +1,23 @@
+import os
+
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import downgrade, upgrade
+
+from models import db
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+def test_migrations_build_the_models_schema(app):
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+        try:
+            with db.engine.connect() as connection:
+                diffs = compare_metadata(MigrationContext.configure(connection), db.metadata)
+        finally:
+            downgrade(directory=MIGRATIONS, revision='base')
+            with db.engine.begin() as connection:
+                connection.execute(db.text('DROP TABLE alembic_version'))
+    assert not diffs, "models.py differs from `flask db upgrade`; add a migration:\n" + \
+        '\n'.join(map(str, diffs))
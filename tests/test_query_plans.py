@@ -0,0 +1,101 @@
+"""EXPLAIN checks that each hot query is answered from its index.
+
+Runs on the test database: SQLite by default, or Postgres when
+TEST_DATABASE_URL points at a scratch database. The tables are created
+from the models and seeded with mostly finished purchases.
+"""
+from datetime import datetime, timedelta
+import pytest
+
+from models import Bundle, MpesaCallback, Session, Transaction, User
+from resources.serializers import SESSION, TRANSACTION_LISTING
+
+ROWS = 5000
+NOW = datetime(2025, 6, 1)
+
+
+@pytest.fixture
+def seeded(db):
+    db.session.execute(db.insert(User), [
+        {'username': f'user{i}', 'phone': f'07{i:08d}', 'password_hash': 'x', 'created_at': NOW}
+        for i in range(50)
+    ])
+    db.session.execute(db.insert(Bundle), [
+        {'name': f'plan-{i}', 'data_amount': '1 GB', 'duration': '1 hours', 'price': 10, 'created_at': NOW}
+        for i in range(20)
+    ])
+    # Mostly finished purchases, as on a site that has been running for a while
+    statuses = ['expired'] * 16 + ['failed'] * 2 + ['completed', 'pending']
+    db.session.execute(db.insert(Transaction), [{
+        'user_id': i % 50 + 1, 'bundle_id': i % 20 + 1, 'amount': 10, 'status': statuses[i % len(statuses)],
+        'mpesa_code': f'R{i:09d}', 'checkout_request_id': f'ws_CO_{i:010d}',
+        'mac_address': f'02:00:00:00:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}', 'ip_address': '10.0.0.1',
+        'created_at': NOW - timedelta(minutes=ROWS - i), 'expires_at': NOW - timedelta(minutes=ROWS - i - 60),
+    } for i in range(ROWS)])
+    db.session.execute(db.insert(Session), [{
+        'user_id': i % 50 + 1, 'bundle_id': i % 20 + 1, 'transaction_id': i + 1, 'session_token': f'token-{i}',
+        'is_active': False, 'created_at': NOW, 'expires_at': NOW,
+    } for i in range(0, ROWS, 5)])
+    db.session.execute(db.insert(MpesaCallback), [{
+        'checkout_request_id': f'ws_CO_{i:010d}', 'payload': '{}', 'status': 'processed' if i % 100 else 'pending',
+        'attempts': 1, 'received_at': NOW,
+    } for i in range(ROWS)])
+    db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+    return db
+
+
+def explain(db, query):
+    statement = getattr(query, 'statement', query)
+    dialect = db.engine.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    # SQLite: "SEARCH transactions USING INDEX ix_... (...)"; Postgres: "Index Scan using ix_... on ..."
+    return '\n'.join(str(row[-1]) for row in db.session.execute(db.text(prefix + sql)))
+
+
+def hot_queries(db):
+    now = NOW
+    return {
+        'callback lookup': (
+            Transaction.query.filter_by(checkout_request_id='ws_CO_0000004321'),
+            'ix_transactions_checkout_request_id'),
+        'expiry sweep sites': (
+            db.session.query(Transaction.router_id).filter(
+                Transaction.expires_at < now, Transaction.status == 'completed').distinct(),
+            'ix_transactions_completed_expires_at'),
+        'expiry scheduler refresh': (
+            db.session.query(Transaction.id, Transaction.expires_at, Transaction.router_id).filter(
+                Transaction.status == 'completed', Transaction.expires_at <= now + timedelta(minutes=10)),
+            'ix_transactions_completed_expires_at'),
+        'still-active MACs': (
+            db.session.query(Transaction.mac_address).filter(
+                Transaction.mac_address.in_(['02:00:00:00:10:E1', '02:00:00:00:10:E2']),
+                Transaction.status == 'completed', Transaction.expires_at >= now),
+            'ix_transactions_mac_address'),
+        'user transactions page': (
+            TRANSACTION_LISTING.query().filter(Transaction.user_id == 7).order_by(Transaction.id.desc()).limit(101),
+            'ix_transactions_user_id_id'),
+        'listing session_id': (
+            TRANSACTION_LISTING.query().order_by(Transaction.id.desc()).limit(101),
+            'ix_sessions_transaction_id'),
+        'user sessions page': (
+            SESSION.query().filter(Session.user_id == 7).order_by(Session.id.desc()).limit(101),
+            'ix_sessions_user_id_id'),
+        'plan lookup': (
+            Bundle.query.filter_by(name='plan-7'),
+            'ix_bundles_name'),
+        'callback resume scan': (
+            db.session.query(MpesaCallback.id).filter(MpesaCallback.status == 'pending').order_by(MpesaCallback.id),
+            'ix_mpesa_callbacks_status'),
+    }
+
+
+def test_hot_queries_use_their_index(seeded):
+    missing = {}
+    for name, (query, index) in hot_queries(seeded).items():
+        plan = explain(seeded, query)
+        if index not in plan:
+            missing[name] = plan
+    assert not missing, '\n\n'.join(f"{name} did not use its index:\n{plan}" for name, plan in missing.items())
@@ -0,0 +1,34 @@
+import pytest
+
+from rate_limits import limiter
+
+
+@pytest.fixture
+def limits(app):
+    limiter.reset()
+    yield limiter
+    limiter.reset()
+
+
+def stk_push(client, headers, phone, mac):
+    # No bundle is seeded, so a request that gets past the limits stops at the 404
+    return client.post('/mpesa/stkpush', headers=headers, json={
+        'phone': phone, 'amount': 10, 'plan': 'none', 'mac_address': mac, 'ip_address': '10.0.0.2'})
+
+
+def test_stk_push_limit_is_per_payer_not_per_address(client, db, auth_headers, limits):
+    # Every device on a hotspot arrives from the site's one NAT address
+    statuses = [stk_push(client, auth_headers, f'07{i:08d}', f'02:00:00:00:{i >> 8:02X}:{i & 0xFF:02X}').status_code
+                for i in range(60)]
+    assert statuses == [404] * 60
+
+
+def test_stk_push_limit_counts_one_phone_in_every_form(client, db, auth_headers, limits):
+    statuses = [stk_push(client, auth_headers, phone, f'02:00:00:00:00:{i:02X}').status_code
+                for i, phone in enumerate(['0712345678', '+254712345678', '254712345678', '0712345678'])]
+    assert statuses == [404, 404, 404, 429]
+
+
+def test_stk_push_limit_per_device(client, db, auth_headers, limits):
+    statuses = [stk_push(client, auth_headers, f'07{i:08d}', '02:00:00:00:00:01').status_code for i in range(4)]
+    assert statuses == [404, 404, 404, 429]
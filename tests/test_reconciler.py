@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+import pytest
+
+from callback_queue import CallbackQueue
+from loadtest.fake_daraja import FakeDaraja
+from loadtest.fake_routeros import FakeRouterOS
+from models import Bundle, MpesaCallback, Transaction, User
+from reconciler import PendingReconciler, query_key
+from resources import mpesa, router as router_module
+from resources.daraja import DarajaClient, get_daraja_client, set_daraja_client
+from resources.router import RouterConnectionPool
+
+CHECKOUT_ID = 'ws_CO_0000000001'
+STK_CALLBACK = {
+    'MerchantRequestID': 'mr-ws_CO_0000000001',
+    'CheckoutRequestID': CHECKOUT_ID,
+    'ResultCode': 0,
+    'ResultDesc': 'The service request is processed successfully.',
+    'CallbackMetadata': {'Item': [
+        {'Name': 'Amount', 'Value': 10},
+        {'Name': 'MpesaReceiptNumber', 'Value': 'RLATE00001'},
+        {'Name': 'TransactionDate', 'Value': 20250601120000},
+        {'Name': 'PhoneNumber', 'Value': 254700000000},
+    ]},
+}
+
+
+@pytest.fixture
+def daraja():
+    server = FakeDaraja(callback_delay=0, callback_loss_rate=1.0).start()
+    previous = get_daraja_client()
+    set_daraja_client(DarajaClient(server.base_url, 'key', 'secret', backoff_base=0.01))
+    yield server
+    set_daraja_client(previous)
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def router():
+    server = FakeRouterOS().start()
+    router_module._router_pools[None] = RouterConnectionPool('127.0.0.1', 'admin', 'admin', port=server.port)
+    yield server
+    router_module.close_router_pools()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def queue(app):
+    queue = CallbackQueue(max_attempts=1)
+    queue.app = app
+    return queue
+
+
+@pytest.fixture
+def pending(db, auth_headers, monkeypatch):
+    monkeypatch.setattr(mpesa, 'recent_checkouts', mpesa.RecentCheckouts())
+    bundle = Bundle(name='1 hour', data_amount='1 GB', duration='1 hours', price=10)
+    db.session.add(bundle)
+    db.session.flush()
+    transaction = Transaction(user_id=User.query.one().id, bundle_id=bundle.id, amount=10, status='pending',
+                              mac_address='02:00:00:00:00:01', ip_address='10.0.0.1',
+                              checkout_request_id=CHECKOUT_ID, created_at=datetime.now() - timedelta(minutes=5))
+    db.session.add(transaction)
+    db.session.commit()
+    return transaction.id
+
+
+def test_late_callback_fills_in_the_receipt(app, db, client, daraja, router, queue, pending):
+    daraja.results[CHECKOUT_ID] = STK_CALLBACK  # the customer paid, the callback was lost
+    reconciler = PendingReconciler(min_age=60, concurrency=1, rate=100)
+    assert reconciler.run(app) == 1
+
+    inbox = MpesaCallback.query.filter_by(checkout_request_id=query_key(CHECKOUT_ID)).one()
+    queue._process(inbox.id)
+    transaction = db.session.get(Transaction, pending)
+    assert transaction.status == 'completed'
+    assert transaction.mpesa_code is None  # STK query answers carry no receipt
+    assert router.commands['/ip/hotspot/ip-binding/add'] == 1
+
+    # Once settled it is not queried again
+    assert reconciler.run(app) == 0
+    assert daraja.hits['stkquery'] == 1
+
+    response = client.post('/mpesa/callback', json={'Body': {'stkCallback': STK_CALLBACK}})
+    assert response.status_code == 200
+    callback = MpesaCallback.query.filter_by(checkout_request_id=CHECKOUT_ID).one()
+    queue._process(callback.id)
+
+    db.session.expire_all()
+    transaction = db.session.get(Transaction, pending)
+    assert transaction.status == 'completed'
+    assert transaction.mpesa_code == 'RLATE00001'
+    assert transaction.transaction_date == '20250601120000'
+    assert db.session.get(MpesaCallback, callback.id).status == 'processed'
+    assert router.commands['/ip/hotspot/ip-binding/add'] == 1  # not authorized twice
+
+
+def test_callback_before_the_query_is_not_queried(app, db, client, daraja, router, queue, pending):
+    daraja.results[CHECKOUT_ID] = STK_CALLBACK
+    client.post('/mpesa/callback', json={'Body': {'stkCallback': STK_CALLBACK}})
+
+    assert PendingReconciler(min_age=60, concurrency=1, rate=100).run(app) == 0
+    assert 'stkquery' not in daraja.hits
@@ -0,0 +1,33 @@
+import time
+from datetime import datetime
+import pytest
+
+from models import Bundle, HourlyRollup, Transaction
+from rollups import RollupCatchUp
+
+
+@pytest.fixture
+def nairobi(monkeypatch):
+    # A host on UTC+3, where local created_at and UTC settled_at are three hours apart
+    monkeypatch.setenv('TZ', 'Africa/Nairobi')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_catch_up_buckets_in_utc(app, db, nairobi):
+    bundle = Bundle(name='1 hour', data_amount='1 GB', duration='1 hours', price=10)
+    db.session.add(bundle)
+    db.session.flush()
+    purchase = dict(bundle_id=bundle.id, amount=10, status='expired', mac_address='02:00:00:00:00:01',
+                    ip_address='10.0.0.1', created_at=datetime(2025, 6, 1, 10, 30))
+    db.session.add_all([
+        Transaction(**purchase),  # settled before settled_at existed
+        Transaction(**purchase, settled_at=datetime(2025, 6, 1, 7, 31)),
+    ])
+    db.session.commit()
+
+    assert RollupCatchUp().run(app) == 2
+    buckets = [(row.bucket, row.transactions) for row in HourlyRollup.query.all()]
+    assert buckets == [(datetime(2025, 6, 1, 7), 2)]
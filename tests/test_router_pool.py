@@ -0,0 +1,127 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from routeros_api import RouterOsApiPool
+
+from loadtest.fake_routeros import FakeRouterOS
+from resources.router import RouterConnectionPool, RouterManager, RouterUnavailable, close_router_pools
+
+
+class CountingRouterOS(FakeRouterOS):
+    """FakeRouterOS that also records the most commands it ever ran at once."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._flight_lock = threading.Lock()
+
+    def execute(self, command, attrs, queries, tag):
+        with self._flight_lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            time.sleep(0.02)
+            return super().execute(command, attrs, queries, tag)
+        finally:
+            with self._flight_lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def router():
+    server = CountingRouterOS().start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_pool(router, **kwargs):
+    return RouterConnectionPool('127.0.0.1', 'admin', 'admin', port=router.port, **kwargs)
+
+
+def authorize(manager, i):
+    return manager.authorize_mac(f'02:00:00:00:00:{i:02X}', f'10.0.0.{i}')
+
+
+def test_pool_reuses_one_connection_across_calls(router):
+    pool = make_pool(router)
+    manager = RouterManager(pool=pool)
+    try:
+        assert all(authorize(manager, i) for i in range(20))
+    finally:
+        pool.close()
+    assert router.connections == 1
+    assert router.commands['/ip/hotspot/ip-binding/add'] == 20
+
+
+def old_authorize_mac(router, i):
+    """What each callback ran before the pool: a new RouterOsApiPool that connected and logged in."""
+    conn = RouterOsApiPool(host='127.0.0.1', username='admin', password='admin', port=router.port, use_ssl=False)
+    try:
+        conn.get_api().get_resource('/ip/hotspot/ip-binding').add(
+            mac_address=f'02:00:00:00:01:{i:02X}', address=f'10.0.1.{i}', to_address=f'10.0.1.{i}',
+            type='bypassed', comment='')
+    finally:
+        conn.disconnect()
+
+
+def test_callbacks_share_the_process_pool(router, monkeypatch):
+    calls = 20
+    for i in range(calls):
+        old_authorize_mac(router, i)
+    assert router.connections == calls
+
+    # apply_stk_callback builds a RouterManager per callback; they now share one pool
+    monkeypatch.setenv('MIKROTIK_HOST', '127.0.0.1')
+    monkeypatch.setenv('MIKROTIK_USERNAME', 'admin')
+    monkeypatch.setenv('MIKROTIK_PASSWORD', 'admin')
+    monkeypatch.setenv('MIKROTIK_API_PORT', str(router.port))
+    close_router_pools()
+    try:
+        assert all(authorize(RouterManager(), i) for i in range(calls))
+    finally:
+        close_router_pools()
+    assert router.connections == calls + 1
+    assert router.commands['/ip/hotspot/ip-binding/add'] == 2 * calls
+
+
+def test_pool_caps_concurrent_sessions(router):
+    pool = make_pool(router, max_sessions=3)
+    manager = RouterManager(pool=pool)
+    try:
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            results = list(executor.map(lambda i: authorize(manager, i), range(60)))
+    finally:
+        pool.close()
+    assert all(results)
+    assert router.connections <= 3
+    assert router.peak_in_flight <= 3
+
+
+def test_pool_times_out_when_every_session_is_busy(router):
+    pool = make_pool(router, max_sessions=1, acquire_timeout=0.1)
+    try:
+        with pool.api():
+            with pytest.raises(RouterUnavailable):
+                with pool.api():
+                    pass
+        with pool.api() as api:
+            assert api.get_resource('/system/identity').get()
+    finally:
+        pool.close()
+
+
+def test_pool_replaces_dropped_session(router):
+    pool = make_pool(router, health_check_interval=0)
+    manager = RouterManager(pool=pool)
+    try:
+        assert authorize(manager, 1)
+        # The router drops the idle socket; the health check finds it dead and reconnects
+        for conn, _, _ in pool._idle:
+            conn.socket.close()
+        assert authorize(manager, 2)
+    finally:
+        pool.close()
+    assert router.connections == 2
@@ -0,0 +1,23 @@
+import pytest
+
+
+@pytest.fixture
+def log_every_request(app):
+    from app import sql_instrumentation
+    slow_ms = sql_instrumentation.slow_ms
+    sql_instrumentation.slow_ms = 0
+    yield sql_instrumentation
+    sql_instrumentation.slow_ms = slow_ms
+
+
+def test_request_summary_names_its_slowest_statement(client, auth_headers, log_every_request, capsys):
+    log_every_request.statement_chars = 30
+    try:
+        assert client.get('/sessions?user_id=1', headers=auth_headers).status_code == 200
+    finally:
+        del log_every_request.statement_chars
+    summary = [line for line in capsys.readouterr().out.splitlines() if line.startswith('Slow request')]
+    assert len(summary) == 1
+    assert summary[0].startswith('Slow request GET /sessions: 1 queries, ')
+    # One line, cut to statement_chars, placeholders and no bind values
+    assert summary[0].endswith(': SELECT sessions.id AS sessions...')
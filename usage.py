@@ -0,0 +1,131 @@
+import os
+import time
+from concurrent.futures import as_completed
+from datetime import datetime
+from collections import defaultdict
+from decimal import Decimal
+from models import db, Transaction, Bundle, UsageSample
+from metrics import metrics
+from rollups import apply_rollups, rollup_key
+from resources.router import RouterManager
+
+
+class UsageCollector:
+    """Meters each purchase's data use from the routers' hotspot host counters.
+
+    Every pass reads bytes-in/bytes-out for all hosts at a site with a single
+    /ip/hotspot/host print and matches them in memory against the site's
+    active transactions, so one pass costs one router round-trip and one
+    SELECT however many hosts are online. The increase since the previous
+    reading is appended to usage_samples and added to Transaction.bytes_used,
+    both written `batch_size` rows per statement, and to the hourly and
+    daily rollups. A transaction's first
+    reading only records the baseline. RouterOS restarts a host's counters
+    when its entry is dropped, so a reading below the stored one is counted
+    from zero. Purchases that reach their bundle's data_cap_bytes are revoked
+    and marked 'capped'.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_env(cls):
+        return cls(batch_size=int(os.environ.get('USAGE_BATCH_SIZE', 1000)))
+
+    def run(self, app):
+        """One collection pass over every site with active purchases; returns how many were capped."""
+        from scheduler import router_fanout
+
+        with app.app_context():
+            router_ids = [router_id for (router_id,) in db.session.query(Transaction.router_id).filter(
+                Transaction.status == 'completed',
+                Transaction.expires_at > datetime.utcnow()
+            ).distinct()]
+
+        futures = {router_fanout.submit(self.collect, app, router_id): router_id for router_id in router_ids}
+        capped = 0
+        for future in as_completed(futures):
+            try:
+                capped += future.result()
+            except Exception as e:
+                print(f"Usage collection for router {futures[future]} failed: {e}")
+        return capped
+
+    def collect(self, app, router_id):
+        """Reads one site's counters, stores the deltas and revokes capped purchases."""
+        from scheduler import revoke_expired
+
+        with app.app_context():
+            started = time.perf_counter()
+            router = RouterManager(router_id)
+            try:
+                counters = router.get_host_counters()
+            except Exception as e:
+                print(f"Usage collection for router {router_id} skipped, could not read hosts: {e}")
+                return 0
+
+            now = datetime.utcnow()
+            active = db.session.query(
+                Transaction.id, Transaction.bundle_id, Transaction.mac_address, Transaction.bytes_used,
+                Transaction.last_bytes_in, Transaction.last_bytes_out, Bundle.data_cap_bytes
+            ).join(Bundle, Bundle.id == Transaction.bundle_id).filter(
+                Transaction.router_id == router_id,
+                Transaction.status == 'completed',
+                Transaction.expires_at > now
+            ).order_by(Transaction.created_at).all()
+
+            metered = set()
+            updates, samples, capped = [], [], []
+            rollups = defaultdict(lambda: [0, Decimal(0), 0])
+            for row in active:
+                mac = row.mac_address.upper()
+                # A device with several purchases uses up the oldest first
+                if mac in metered or mac not in counters:
+                    continue
+                metered.add(mac)
+
+                bytes_in, bytes_out = counters[mac]
+                bytes_used = row.bytes_used
+                if (bytes_in, bytes_out) != (row.last_bytes_in, row.last_bytes_out):
+                    if row.last_bytes_in is None:
+                        delta_in = delta_out = 0
+                    else:
+                        delta_in = bytes_in - row.last_bytes_in if bytes_in >= row.last_bytes_in else bytes_in
+                        delta_out = bytes_out - row.last_bytes_out if bytes_out >= row.last_bytes_out else bytes_out
+
+                    bytes_used += delta_in + delta_out
+                    updates.append({'id': row.id, 'bytes_used': bytes_used,
+                                    'last_bytes_in': bytes_in, 'last_bytes_out': bytes_out})
+                    if delta_in or delta_out:
+                        samples.append({'transaction_id': row.id, 'sampled_at': now,
+                                        'bytes_in': delta_in, 'bytes_out': delta_out})
+                        rollups[rollup_key(now, row.bundle_id, router_id, 'completed')][2] += delta_in + delta_out
+                # Also retries revocations that failed on an earlier pass
+                if row.data_cap_bytes is not None and bytes_used >= row.data_cap_bytes:
+                    capped.append(row)
+
+            for start in range(0, len(updates), self.batch_size):
+                db.session.execute(db.update(Transaction), updates[start:start + self.batch_size])
+            for start in range(0, len(samples), self.batch_size):
+                db.session.execute(db.insert(UsageSample), samples[start:start + self.batch_size])
+            apply_rollups(rollups)
+            db.session.commit()
+            metrics.incr('usage_samples', len(samples))
+            metrics.observe('usage_collect_seconds', time.perf_counter() - started)
+
+            if capped:
+                if revoke_expired(capped, now, router, status='capped'):
+                    metrics.incr('usage_capped', len(capped))
+                    print(f"Revoked {len(capped)} sessions over their data cap on router {router_id}.")
+                else:
+                    print(f"Router {router_id} unavailable, {len(capped)} capped sessions will be retried.")
+                    return 0
+            return len(capped)
+
+
+usage_collector = UsageCollector.from_env()
+
+
+def collect_usage(app):
+    usage_collector.run(app)
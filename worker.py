@@ -0,0 +1,26 @@
+"""Runs the background jobs in a dedicated process instead of inside the web workers.
+
+    BACKGROUND_JOBS=false gunicorn -w 4 app:app
+    python worker.py
+
+Leader election still applies, so a second worker.py on another host is a
+hot standby that takes over if this one dies.
+"""
+import signal
+import threading
+from app import app
+from scheduler import job_leader
+
+
+def main():
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    job_leader.start(app)
+    stopping.wait()
+    job_leader.stop()
+
+
+if __name__ == "__main__":
+    main()